@@ -39,7 +39,7 @@ def main():
   bot = commands.Bot(command_prefix='!')
   bot.add_cog(prompts.Prompts(PROMPTS))
   bot.add_cog(inactive.Pruner(bot, PRUNE_CONF))
-  bot.add_cog(discussion_queue.TalkQueue())
+  bot.add_cog(discussion_queue.TalkQueue(bot))
   bot.add_cog(quote_quiz.QuoteQuiz(QUOTES))
   bot.add_cog(eight_ball.EightBall())
   bot.run(token)
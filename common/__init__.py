@@ -0,0 +1,5 @@
+#!/bin/python
+
+from . import heap
+from . import journal
+from . import shuffle
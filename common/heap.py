@@ -0,0 +1,96 @@
+#!/bin/python
+
+import heapq
+import itertools
+
+# Returned by _pop_live for a stale entry, as None may be a key.
+_STALE = object()
+
+
+def mostly_stale(total, live):
+  """Whether a structure holding total entries, of which live are live, is worth rebuilding."""
+  return total > 2 * live + 64
+
+
+class LazyHeap:
+  """Keys ordered by a priority that can be changed or removed, lowest first.
+
+  Setting a key pushes a new heap entry and leaves the old one in place;
+  entries that are no longer their key's current one are skipped when they
+  reach the top. The heap is rebuilt when stale entries outnumber live ones.
+  Keys with the same priority come out in the order they were set, so keys
+  never need to be comparable.
+
+    set, discard, pop: O(log n) amortized
+    nsmallest(k): O(n log k)
+    rank: O(n), without sorting
+  """
+
+  def __init__(self):
+    self.heap = []
+    # key => (priority, sequence number) of its live heap entry.
+    self.entry = {}
+    self.seq = itertools.count()
+
+  def __len__(self):
+    return len(self.entry)
+
+  def __contains__(self, key):
+    return key in self.entry
+
+  def _live(self):
+    return (e for e in self.heap if self.entry.get(e[2]) == e[:2])
+
+  def _pop_live(self):
+    priority, seq, key = heapq.heappop(self.heap)
+    if self.entry.get(key) != (priority, seq):
+      return _STALE
+    del self.entry[key]
+    return key
+
+  def set(self, key, priority):
+    """Set (or move) the priority of a key."""
+    if key in self.entry and self.entry[key][0] == priority:
+      return
+    entry = (priority, next(self.seq))
+    self.entry[key] = entry
+    heapq.heappush(self.heap, entry + (key,))
+    if mostly_stale(len(self.heap), len(self.entry)):
+      self.heap = list(self._live())
+      heapq.heapify(self.heap)
+
+  def discard(self, key):
+    self.entry.pop(key, None)
+
+  def pop(self):
+    """Remove and return the key with the lowest priority."""
+    while self.heap:
+      key = self._pop_live()
+      if key is not _STALE:
+        return key
+    raise IndexError('pop from an empty LazyHeap')
+
+  def pop_until(self, limit):
+    """Remove and return all keys with a priority at or below limit, lowest first."""
+    popped = []
+    while self.heap and self.heap[0][0] <= limit:
+      key = self._pop_live()
+      if key is not _STALE:
+        popped.append(key)
+    return popped
+
+  def nsmallest(self, k):
+    """The k keys with the lowest priorities, lowest first."""
+    return [e[2] for e in heapq.nsmallest(k, self._live())]
+
+  def ordered(self):
+    """All keys, lowest priority first."""
+    return [e[2] for e in sorted(self._live())]
+
+  def rank(self, key):
+    """Return the 0-based position of a key in priority order."""
+    entry = self.entry[key]
+    return sum(1 for e in self.entry.values() if e < entry)
+
+
+# vim:ts=2:sw=2:expandtab
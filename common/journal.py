@@ -0,0 +1,113 @@
+#!/bin/python
+
+import logging
+import os
+
+# How far back to look at a time for the last complete line.
+TAIL_CHUNK = 4096
+
+
+class Journal:
+  """A snapshot file plus an append-only log of the changes made since.
+
+  Changes are appended to `filename.log` one line each. To compact, rotate()
+  moves the log aside to `filename.log.1` and the caller writes a fresh
+  snapshot with write_snapshot(), which removes the old log once the
+  snapshot is in place. Changes made while the snapshot is being written go
+  to a new log, and a crash at any point leaves the snapshot and logs
+  together holding every change.
+
+  A crash mid-append can leave a partial last line. Readers stop at it and
+  the next append cuts it off first, so it never swallows a new line.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.log_filename = filename + '.log'
+    # The log being compacted; kept until the snapshot including it is written.
+    self.old_log_filename = filename + '.log.1'
+
+  def drop_stale(self):
+    """Remove an old log that the snapshot already includes.
+
+    The snapshot is written after the log is moved aside, so a newer snapshot
+    means a crash came between writing it and removing the old log.
+    """
+    if (os.path.exists(self.old_log_filename) and os.path.exists(self.filename)
+        and os.stat(self.filename).st_mtime_ns >= os.stat(self.old_log_filename).st_mtime_ns):
+      os.remove(self.old_log_filename)
+
+  def read(self, filename, offset=0):
+    """Yield (line, offset after the line) for the complete lines of a log past offset."""
+    if not os.path.exists(filename):
+      return
+    with open(filename, 'rb') as f:
+      f.seek(offset)
+      for line in f:
+        if not line.endswith(b'\n'):
+          logging.warning('Ignoring partial last line of %s: %r', filename, line)
+          return
+        offset += len(line)
+        yield line, offset
+
+  def replay(self):
+    """Yield the complete lines of the old log then the live one."""
+    for filename in (self.old_log_filename, self.log_filename):
+      for line, _ in self.read(filename):
+        yield line
+
+  def append(self, data: str, filename=None):
+    """Append whole lines to the log and sync them to disk."""
+    with open(filename or self.log_filename, 'a+b') as f:
+      _cut_partial_line(f)
+      f.write(data.encode('utf-8'))
+      f.flush()
+      os.fsync(f.fileno())
+
+  def rotate(self):
+    """Move the log aside, ahead of writing a snapshot."""
+    if not os.path.exists(self.log_filename):
+      return
+    if os.path.exists(self.old_log_filename):
+      # A previous compaction died before finishing; keep both logs' changes.
+      with open(self.log_filename, 'rb') as new:
+        self.append(new.read().decode('utf-8'), self.old_log_filename)
+      os.remove(self.log_filename)
+    else:
+      os.replace(self.log_filename, self.old_log_filename)
+
+  def write_snapshot(self, write, mode='wt'):
+    """Atomically replace the snapshot with what write(f) writes, then drop the old log."""
+    tmp = self.filename + '.tmp'
+    with open(tmp, mode) as f:
+      write(f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, self.filename)
+    if os.path.exists(self.old_log_filename):
+      os.remove(self.old_log_filename)
+
+
+def _cut_partial_line(f):
+  """Truncate a file opened for appending back to its last complete line."""
+  end = f.seek(0, os.SEEK_END)
+  if not end:
+    return
+  f.seek(end - 1)
+  if f.read(1) == b'\n':
+    return
+  keep = 0
+  pos = end
+  while pos > 0:
+    start = max(0, pos - TAIL_CHUNK)
+    f.seek(start)
+    i = f.read(pos - start).rfind(b'\n')
+    if i >= 0:
+      keep = start + i + 1
+      break
+    pos = start
+  logging.warning('Cutting off a partial line at the end of %s', f.name)
+  f.truncate(keep)
+
+
+# vim:ts=2:sw=2:expandtab
@@ -0,0 +1,36 @@
+#!/bin/python
+
+import random
+
+
+class LazyShuffle:
+  """A Fisher-Yates shuffle of range(n), done lazily.
+
+  Only positions touched by a swap are stored, so starting a shuffle costs
+  nothing and nothing is copied. n may grow between draws; the new
+  positions join the undrawn range.
+  """
+
+  def __init__(self, rand=random):
+    self.rand = rand
+    self.reset()
+
+  def reset(self):
+    """Start a new shuffle."""
+    # position => value, for positions that no longer hold their own.
+    self.swapped = {}
+    self.drawn = 0
+
+  def draw(self, n):
+    """Return the next value of the shuffle of range(n). Needs drawn < n."""
+    i = self.drawn
+    j = self.rand.randrange(i, n)
+    # Swap positions i and j; position i is never looked at again.
+    picked = self.swapped.pop(j, j)
+    if j != i:
+      self.swapped[j] = self.swapped.pop(i, i)
+    self.drawn += 1
+    return picked
+
+
+# vim:ts=2:sw=2:expandtab
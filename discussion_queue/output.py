@@ -0,0 +1,114 @@
+#!/bin/python
+
+import asyncio
+import discord
+import itertools
+import logging
+
+
+# Message priorities; lower goes first.
+PROMPT = 0
+INFO = 1
+STATUS = 2
+
+
+class Output:
+  """Messages from a discussion to its text channel.
+
+  Messages are sent one at a time, with speaker change prompts ahead of
+  informational messages. Queue status updates made within `delay` seconds
+  of each other are coalesced into one edit of a single pinned status
+  message.
+  """
+
+  def __init__(self, channel, delay=2):
+    self.channel = channel
+    self.delay = delay
+    self.status_message = None
+    self.pending_status = None
+    self.queue = asyncio.PriorityQueue()
+    self.seq = itertools.count()
+    self.sender = None
+    self.status_timer = None
+
+  def _put(self, priority, msg):
+    self.queue.put_nowait((priority, next(self.seq), msg))
+    self._start_sender()
+
+  def _start_sender(self):
+    if self.sender is None or self.sender.done():
+      self.sender = asyncio.create_task(self._send_loop())
+
+  def prompt(self, msg):
+    """Send a speaker change prompt, ahead of any other pending messages."""
+    self._put(PROMPT, msg)
+
+  def info(self, msg):
+    """Send an informational message."""
+    self._put(INFO, msg)
+
+  def status(self, msg):
+    """Show msg in the status message once updates settle."""
+    self.pending_status = msg
+    if self.status_timer is None:
+      self.status_timer = asyncio.create_task(self._status_after_delay())
+
+  async def _status_after_delay(self):
+    await asyncio.sleep(self.delay)
+    self.status_timer = None
+    self._put(STATUS, None)
+
+  async def _send_loop(self):
+    while True:
+      priority, _, msg = await self.queue.get()
+      try:
+        if priority == STATUS:
+          await self._update_status()
+        else:
+          logging.info('send(%s)', msg)
+          await self.channel.send(msg)
+      except Exception:
+        # Network errors and timeouts as well as HTTP errors; keep sending.
+        logging.exception('Failed to send to %s', self.channel.name)
+      finally:
+        self.queue.task_done()
+
+  async def _update_status(self):
+    msg, self.pending_status = self.pending_status, None
+    if msg is None:
+      return
+    if self.status_message is not None:
+      try:
+        await self.status_message.edit(content=msg)
+        return
+      except discord.NotFound:
+        self.status_message = None
+    self.status_message = await self.channel.send(msg)
+    try:
+      await self.status_message.pin()
+    except discord.HTTPException:
+      logging.warning('Unable to pin the status message in %s', self.channel.name)
+
+  async def close(self):
+    """Send everything pending then unpin the status message."""
+    if self.status_timer is not None:
+      self.status_timer.cancel()
+      self.status_timer = None
+      self._put(STATUS, None)
+    if not self.queue.empty():
+      self._start_sender()
+      # Stop waiting if the sender dies instead of draining the queue.
+      drained = asyncio.create_task(self.queue.join())
+      await asyncio.wait([drained, self.sender], return_when=asyncio.FIRST_COMPLETED)
+      drained.cancel()
+    if self.sender is not None:
+      self.sender.cancel()
+      self.sender = None
+    if self.status_message is not None:
+      try:
+        await self.status_message.unpin()
+      except discord.HTTPException:
+        pass
+
+
+# vim:ts=2:sw=2:expandtab
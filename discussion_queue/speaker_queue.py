@@ -0,0 +1,212 @@
+#!/bin/python
+
+import sys
+import time
+
+try:
+  from ..common import heap
+except ImportError:
+  # bot.py runs from the repository root, where the cogs are top-level packages.
+  from common import heap
+
+
+# Marks a slot popped from the front that is still counted in the tree.
+_GHOST = object()
+
+
+class SpeakerQueue:
+  """An insertion ordered queue with fast membership, position and removal.
+
+  Members occupy slots in an array; a Fenwick tree over the slots counts the
+  live ones so a member's position is a prefix sum. Removal clears a slot,
+  popping from the front advances a head pointer and appending adds a slot,
+  so none of them shift other members. Inserting in the middle rebuilds the
+  slots, which is O(n) but only used by mod commands.
+
+  Popping from the front leaves the slot counted in the tree as a ghost; all
+  ghosts sit ahead of the head so positions just subtract the ghost count.
+
+    membership, pop front: O(1) amortized
+    append, remove, position, insert at front: O(log n)
+    insert elsewhere: O(n)
+  """
+
+  # Free slots left ahead of the head on rebuild for cheap inserts at the front.
+  GAP = 16
+
+  def __init__(self, members=()):
+    self._rebuild(list(members))
+
+  def _rebuild(self, members):
+    self._slots = [None] * self.GAP + members
+    self._slot = {m: i for i, m in enumerate(self._slots) if m is not None}
+    if len(self._slot) != len(members):
+      raise ValueError('SpeakerQueue members must be unique')
+    self._head = self.GAP
+    self._ghosts = 0
+    # Linear time Fenwick tree construction. Index i + 1 holds slot i.
+    tree = [0] + [0 if m is None else 1 for m in self._slots]
+    for i in range(1, len(tree)):
+      parent = i + (i & -i)
+      if parent < len(tree):
+        tree[parent] += tree[i]
+    self._tree = tree
+
+  def _add(self, slot, delta):
+    i = slot + 1
+    while i < len(self._tree):
+      self._tree[i] += delta
+      i += i & -i
+
+  def _prefix(self, slot):
+    """Count of live slots up to and including slot."""
+    total = 0
+    i = slot + 1
+    while i > 0:
+      total += self._tree[i]
+      i -= i & -i
+    return total
+
+  def _compact(self):
+    if heap.mostly_stale(len(self._slots), len(self._slot)):
+      self._rebuild(list(self))
+
+  def __len__(self):
+    return len(self._slot)
+
+  def __contains__(self, member):
+    return member in self._slot
+
+  def __iter__(self):
+    for i in range(self._head, len(self._slots)):
+      member = self._slots[i]
+      if member is not None:
+        yield member
+
+  def __repr__(self):
+    return 'SpeakerQueue(%r)' % list(self)
+
+  def head(self, n):
+    """Return the first n members."""
+    out = []
+    for member in self:
+      if len(out) == n:
+        break
+      out.append(member)
+    return out
+
+  def index(self, member):
+    """Return the 0-based position of a member."""
+    return self._prefix(self._slot[member]) - self._ghosts - 1
+
+  def append(self, member):
+    if member in self._slot:
+      raise ValueError('%r is already queued' % member)
+    slot = len(self._slots)
+    self._slots.append(member)
+    self._slot[member] = slot
+    # The new tree node covers slots (i - lowbit(i), i].
+    i = slot + 1
+    self._tree.append(1 + self._prefix(slot - 1) - self._prefix(i - (i & -i) - 1))
+
+  def appendleft(self, member):
+    if member in self._slot:
+      raise ValueError('%r is already queued' % member)
+    if self._head == 0:
+      self._rebuild(list(self))
+    # Everything ahead of the head is a free slot. A ghost is already counted.
+    self._head -= 1
+    if self._slots[self._head] is _GHOST:
+      self._ghosts -= 1
+    else:
+      self._add(self._head, 1)
+    self._slots[self._head] = member
+    self._slot[member] = self._head
+
+  def insert(self, pos, member):
+    """Insert a member before position pos, like list.insert."""
+    if pos < 0:
+      pos = max(0, len(self) + pos)
+    if pos == 0:
+      self.appendleft(member)
+    elif pos >= len(self):
+      self.append(member)
+    else:
+      if member in self._slot:
+        raise ValueError('%r is already queued' % member)
+      members = list(self)
+      members.insert(pos, member)
+      self._rebuild(members)
+
+  def remove(self, member):
+    slot = self._slot.pop(member)
+    self._slots[slot] = None
+    self._add(slot, -1)
+    self._compact()
+
+  def discard(self, member):
+    if member in self._slot:
+      self.remove(member)
+
+  def popleft(self):
+    if not self._slot:
+      raise IndexError('pop from an empty SpeakerQueue')
+    while self._slots[self._head] is None:
+      self._head += 1
+    member = self._slots[self._head]
+    del self._slot[member]
+    self._slots[self._head] = _GHOST
+    self._head += 1
+    self._ghosts += 1
+    self._compact()
+    return member
+
+  def move(self, member, pos):
+    """Move a queued member to position pos."""
+    self.remove(member)
+    self.insert(pos, member)
+
+
+class FairShare(heap.LazyHeap):
+  """Queued members ordered by how long they have spoken, then by when they queued.
+
+  A member's speaking time does not change while they wait, so each member
+  gets a single heap entry when queued.
+  """
+
+  def push(self, member, spoken):
+    self.set(member, spoken)
+
+  def head(self, k):
+    """The next k members to be popped, in order."""
+    return self.nsmallest(k)
+
+  def index(self, member):
+    """Return the 0-based position of a queued member."""
+    return self.rank(member)
+
+
+def bench(n):
+  """Time a round of n members: append all, look up positions, pop all."""
+  q = SpeakerQueue()
+  start = time.perf_counter()
+  for i in range(n):
+    if i not in q:
+      q.append(i)
+  for i in range(0, n, max(1, n // 100)):
+    q.index(i)
+  while q:
+    q.popleft()
+  return time.perf_counter() - start
+
+
+def main():
+  for n in (100, 1000, 10000, 100000):
+    elapsed = bench(n)
+    print('%6d members: %8.2f ms, %.2f us per member' % (n, elapsed * 1000, elapsed / n * 1e6))
+
+
+if __name__ == '__main__':
+  main()
+
+# vim:ts=2:sw=2:expandtab
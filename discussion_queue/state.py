@@ -0,0 +1,105 @@
+#!/bin/python
+
+import asyncio
+import json
+import logging
+import os
+
+
+class SessionStore:
+  """Persist discussion sessions so they survive a restart.
+
+  Each change appends the latest state of the changed session as a single
+  JSON line, batched over `delay` seconds. An ended session is recorded as
+  a null state. On load, the last line per session wins. The file is
+  rewritten down to one line per live session on load, and whenever it
+  grows past COMPACT_FACTOR lines per live session.
+  """
+
+  # Lines per live session before the file is rewritten.
+  COMPACT_FACTOR = 50
+
+  def __init__(self, filename, delay=1):
+    self.filename = filename
+    self.delay = delay
+    # session key => Session, or None once ended.
+    self.dirty = {}
+    # session key => Session, for sessions changed since load and not ended.
+    self.live = {}
+    # Sessions loaded but not changed since; key => saved state.
+    self.saved = {}
+    self.lines = 0
+    self.timer = None
+
+  def load(self):
+    """Return the saved state of each live session."""
+    states = {}
+    if os.path.exists(self.filename):
+      with open(self.filename, 'rt') as f:
+        for line in f:
+          try:
+            record = json.loads(line)
+            states[tuple(record['key'])] = record['state']
+          except (ValueError, KeyError, TypeError):
+            logging.warning('Skipping malformed session record: %r', line)
+    self.saved = {k: v for k, v in states.items() if v is not None}
+    self._rewrite()
+    return list(self.saved.values())
+
+  def _rewrite(self):
+    """Replace the file with one line per live session."""
+    states = dict(self.saved)
+    states.update((key, session.snapshot()) for key, session in self.live.items())
+    tmp = self.filename + '.tmp'
+    with open(tmp, 'wt') as f:
+      for key, state in states.items():
+        f.write(json.dumps({'key': key, 'state': state}) + '\n')
+    os.replace(tmp, self.filename)
+    self.lines = len(states)
+
+  def changed(self, session):
+    self.dirty[session.key] = session
+    self.live[session.key] = session
+    self.saved.pop(session.key, None)
+    self._schedule()
+
+  def ended(self, key):
+    self.dirty[key] = None
+    self.live.pop(key, None)
+    self.saved.pop(key, None)
+    self._schedule()
+
+  def _schedule(self):
+    if self.timer is None:
+      self.timer = asyncio.create_task(self._flush_later())
+
+  async def _flush_later(self):
+    await asyncio.sleep(self.delay)
+    self.timer = None
+    self.flush()
+
+  def close(self):
+    """Write anything pending now rather than after the delay."""
+    if self.timer is not None:
+      self.timer.cancel()
+      self.timer = None
+    self.flush()
+
+  def flush(self):
+    if not self.dirty:
+      return
+    if self.lines + len(self.dirty) > self.COMPACT_FACTOR * max(1, len(self.live) + len(self.saved)):
+      self.dirty = {}
+      self._rewrite()
+      return
+    lines = []
+    for key, session in self.dirty.items():
+      state = session.snapshot() if session is not None else None
+      lines.append(json.dumps({'key': key, 'state': state}) + '\n')
+    self.dirty = {}
+    with open(self.filename, 'at') as f:
+      f.write(''.join(lines))
+    self.lines += len(lines)
+
+
+# vim:ts=2:sw=2:expandtab
@@ -1,13 +1,21 @@
 #!/bin/python
 
+import asyncio
+import collections
 import discord
 import enum
 import logging
 import os
 import sys
+import time
 
 from discord.ext import commands
 
+from . import output
+from . import speaker_queue
+from . import state
+from . import voice
+
 # Help display messages.
 HELP_START = """Start a moderated discussion.
 You must be in a voice channel which becomes the discussion channel.
@@ -26,6 +34,9 @@ HELP_MOVE = '(mods) Move user to a specified position in the queue.'
 HELP_OPEN = '(mods) Pause the queue, unmute everyone.'
 HELP_PAUSE = '(mods) Pause the queue, unmute mods.'
 HELP_RESUME = '(mods) Resume the speaking queue.'
+HELP_FAIR = '(mods) Order the queue by least time spoken: !fair on|off.'
+HELP_TIMELIMIT = '(mods) Limit each turn to some seconds: !timelimit <seconds>|off.'
+HELP_TALKTIME = 'List how long people have spoken.'
 
 
 class State(enum.Enum):
@@ -38,81 +49,219 @@ class State(enum.Enum):
     return self != State.STOPPED
 
 
-class TalkQueue(commands.Cog):
-  """Provide a voice queue where only one person can talk at a time."""
-
-  qualified_name = 'Talk Queue'
+class Session:
+  """A moderated discussion in one voice channel, run from one text channel."""
 
-  def __init__(self):
-    super(TalkQueue, self).__init__()
-    self.running = State.STOPPED
+  def __init__(self, host, text_channel, voice_channel, mute_concurrency=10):
+    self.mute_concurrency = mute_concurrency
+    self.running = State.RUNNING
+    self.queue = speaker_queue.SpeakerQueue()
+    self.active = None
+    self.topic = None
+    self.text_channel = text_channel
+    self.voice_channel = voice_channel
+    self.host = host
     self.muted = set()
-
-  # Helper methods
+    # Members in the voice channel; kept in sync by on_voice_state_update.
+    self.present = set(voice_channel.members)
+    self.output = output.Output(text_channel)
+    # Set by the cog when persistence is enabled.
+    self.store = None
+    # member id => seconds spent as the active speaker.
+    self.spoken = collections.Counter()
+    self.turn_started = None
+    self.turn_timer = None
+    # Seconds before a turn auto-advances, if set.
+    self.turn_limit = None
+    # Pick the queued member that has spoken least rather than the first.
+    self.fair = False
+    self.fair_queue = speaker_queue.FairShare()
+
+  @property
+  def key(self):
+    return (self.voice_channel.guild.id, self.voice_channel.id)
+
+  def changed(self):
+    """Note a state change so the session gets persisted."""
+    if self.store is not None:
+      self.store.changed(self)
+
+  def snapshot(self):
+    """The session state, with members and channels as ids."""
+    status = self.output.status_message
+    return {
+      'guild': self.voice_channel.guild.id,
+      'voice_channel': self.voice_channel.id,
+      'text_channel': self.text_channel.id,
+      'host': self.host.id,
+      'running': self.running.name,
+      'queue': [m.id for m in self.queue],
+      'active': self.active.id if self.active else None,
+      'topic': self.topic,
+      'muted': [m.id for m in self.muted],
+      'status_message': status.id if status else None,
+      'spoken': dict(self.spoken),
+      'turn_limit': self.turn_limit,
+      'fair': self.fair,
+    }
 
   async def mute(self, member):
     """Mute a member."""
     if not member.voice or member.voice.mute:
       return
-    await member.edit(mute=True)
-    self.muted.add(member)
+    if await voice.set_mute(member, True):
+      self.muted.add(member)
+      self.changed()
 
   async def unmute(self, member):
     """Unmute a member."""
     if not member.voice or not member.voice.mute:
       return
-    await member.edit(mute=False)
-    if member in self.muted:
-      self.muted.remove(member)
+    if await voice.set_mute(member, False):
+      self.muted.discard(member)
+      self.changed()
+
+  async def bulkMute(self, members, mute=True):
+    """(Un)mute many members concurrently, tracking who ends up muted.
+
+    Only members whose edit succeeded are added to or removed from self.muted
+    so a later bulkMute (eg on end) can retry the ones that failed.
+    """
+    result = await voice.bulk_mute(list(members), mute, self.mute_concurrency)
+    if mute:
+      self.muted.update(result.succeeded)
+    else:
+      self.muted.difference_update(result.succeeded)
+    logging.info('bulkMute(%s): %s', mute, result)
+    self.changed()
+    return result
 
   def setTopic(self, ctx):
     """Set the topic from a context."""
     msg = ctx.message.content
     if ' ' in msg:
       self.topic = msg[msg.index(' ') + 1:]
+      self.changed()
 
-  async def send(self, ctx, msg):
-    """Send a message to Discord, logging it."""
-    logging.info('send(%s)', msg)
-    await ctx.send(msg)
+  def send(self, msg):
+    """Send an informational message to the text channel."""
+    self.output.info(msg)
 
-  async def addToQueue(self, ctx, member, pos=None):
-    if member == self.active:
-      msg = '%s is already in the active speaker.' % member.display_name
-      await self.send(ctx, msg)
-    elif member in self.queue:
-      msg = '%s is already in the queue (%d/%d).' % (member.display_name, self.queue.index(member) + 1, len(self.queue))
-      await self.send(ctx, msg)
+  def updateStatus(self):
+    """Refresh the pinned queue status message."""
+    self.output.status(self.getQueue())
+    self.changed()
+
+  def enqueue(self, member, pos=None):
+    """Put a member in the queue, at the end or at position pos."""
+    if pos is None:
+      self.queue.append(member)
     else:
-      if pos is None:
-        pos = len(self.queue)
       self.queue.insert(pos, member)
-      if not self.active:
-        await self.setActive(ctx)
-      await self.send(ctx, 'Added: %s (position %d). %s' % (member.display_name, len(self.queue), self.getQueue()))
+    self.fair_queue.push(member, self.spoken[member.id])
+
+  def dequeue(self, member):
+    """Remove a member from the queue, if queued."""
+    self.queue.discard(member)
+    self.fair_queue.discard(member)
+
+  def popNext(self):
+    """Remove and return the next member to speak."""
+    if self.fair:
+      member = self.fair_queue.pop()
+      self.queue.remove(member)
+    else:
+      member = self.queue.popleft()
+      self.fair_queue.discard(member)
+    return member
+
+  def upcoming(self, n=None):
+    """Queued members in the order they will speak."""
+    if self.fair:
+      return self.fair_queue.ordered() if n is None else self.fair_queue.head(n)
+    return list(self.queue) if n is None else self.queue.head(n)
+
+  def position(self, member):
+    """The 1-based position at which a queued member will speak."""
+    if self.fair:
+      return self.fair_queue.index(member) + 1
+    return self.queue.index(member) + 1
+
+  async def startTurn(self, member):
+    """Make a member the active speaker, starting the clock on their turn."""
+    self.active = member
+    self.turn_started = time.monotonic()
+    if self.turn_limit:
+      self.turn_timer = asyncio.create_task(self.expireTurn(member))
+    await self.unmute(member)
+
+  def recordTurn(self):
+    """Add the active speaker's time so far to their total and stop the turn timer."""
+    if self.turn_timer is not None:
+      self.turn_timer.cancel()
+      self.turn_timer = None
+    if self.active and self.turn_started is not None:
+      self.spoken[self.active.id] += time.monotonic() - self.turn_started
+    self.turn_started = None
+    self.changed()
+
+  async def finishTurn(self):
+    """Mute the active speaker and end their turn."""
+    if not self.active:
+      return
+    self.recordTurn()
+    await self.mute(self.active)
+    logging.info('finishTurn(): mute %s', self.active.display_name)
+    self.active = None
+
+  async def expireTurn(self, member):
+    """Auto-advance when the speaker runs over the time limit."""
+    await asyncio.sleep(self.turn_limit)
+    if self.active != member or self.running != State.RUNNING:
+      return
+    self.turn_timer = None
+    self.output.prompt("%s, time's up." % member.mention)
+    await self.finishTurn()
+    await self.setActive()
 
-  async def setActive(self, ctx):
+  async def addToQueue(self, member, pos=None):
+    """Add a member to the queue. Returns True if they were added."""
+    if member == self.active:
+      msg = '%s is already in the active speaker.' % member.display_name
+      self.send(msg)
+      return False
+    if member in self.queue:
+      msg = '%s is already in the queue (%d/%d).' % (member.display_name, self.position(member), len(self.queue))
+      self.send(msg)
+      return False
+    self.enqueue(member, pos)
+    if not self.active:
+      await self.setActive()
+    self.updateStatus()
+    return True
+
+  async def setActive(self):
     """Set a member to the active talker, unmuting them."""
     if self.active:
       logging.info('setActive(): already got someone active; nothing to do here.')
+      return
 
     while not self.active and self.queue:
-      member = self.queue.pop(0)
-      if not member.voice:
+      member = self.popNext()
+      if member not in self.present:
         logging.info('setActive(%s): member is not on voice', member.display_name)
         continue
-      self.active = member
-      await self.unmute(member)
+      await self.startTurn(member)
 
       msg = []
       msg.append('%s is now  active' % member.mention)
       if self.topic:
         msg.append('topic: %s' % self.topic)
-      msg.append(self.getQueue())
-      await self.send(ctx, ' | '.join(msg))
+      self.output.prompt(' | '.join(msg))
       break
     else:
-      await self.send(ctx, 'There is no one in the queue.')
+      self.send('There is no one in the queue.')
+    self.updateStatus()
 
   def getQueue(self, member=None, full=False):
     """String output of the queue."""
@@ -124,18 +273,39 @@ class TalkQueue(commands.Cog):
       q.append('No active speaker')
     if member:
       if member in self.queue:
-        q.append('%s is #%d' % (member.display_name, self.queue.index(member) + 1))
+        q.append('%s is #%d' % (member.display_name, self.position(member)))
       else:
         q.append('%s is not queued' % member.display_name)
     if self.queue:
       if full:
-        q.append('%d waiting: %s' % (len(self.queue), ', '.join(m.display_name for m in self.queue)))
+        q.append('%d waiting: %s' % (len(self.queue), ', '.join(m.display_name for m in self.upcoming())))
       else:
-        q.append('Next %d of %d: %s' % (min(len(self.queue), 5), len(self.queue), ', '.join(m.display_name for m in self.queue[:5])))
+        q.append('Next %d of %d: %s' % (min(len(self.queue), 5), len(self.queue), ', '.join(m.display_name for m in self.upcoming(5))))
     else:
       q.append('None on remaining in the queue')
     return ' | '.join(q)
 
+  async def memberJoined(self, member):
+    """Mute a member joining the voice channel mid-discussion."""
+    self.present.add(member)
+    logging.info('%s joined voice; mute', member.display_name)
+    await self.mute(member)
+
+  async def memberLeft(self, member):
+    """Drop a member that left the voice channel from the queue or the floor."""
+    self.present.discard(member)
+    if member in self.queue:
+      self.dequeue(member)
+      self.updateStatus()
+    if member == self.active:
+      self.recordTurn()
+      self.active = None
+      self.send('%s left the voice channel.' % member.display_name)
+      if self.running == State.RUNNING:
+        await self.setActive()
+      else:
+        self.updateStatus()
+
   def isMod(self, member):
     """Check if a member (or ctx author) is a mod.
 
@@ -144,36 +314,157 @@ class TalkQueue(commands.Cog):
     """
     return self.host == member or member.permissions_in(self.text_channel).manage_messages
 
+
+class TalkQueue(commands.Cog):
+  """Provide a voice queue where only one person can talk at a time."""
+
+  qualified_name = 'Talk Queue'
+  # Voice state edits sent at once by bulk (un)mutes.
+  MUTE_CONCURRENCY = 10
+
+  def __init__(self, bot=None):
+    super(TalkQueue, self).__init__()
+    self.bot = bot
+    # (guild id, voice channel id) => Session
+    self.sessions = {}
+    # text channel id => Session
+    self.by_text_channel = {}
+    filename = os.getenv('TALKQUEUE_STATEFILE')
+    self.store = state.SessionStore(filename) if filename else None
+    self.restored = False
+
+  def cog_unload(self):
+    if self.store is not None:
+      self.store.close()
+
+  # Helper methods
+
+  def addSession(self, session):
+    self.sessions[session.key] = session
+    self.by_text_channel[session.text_channel.id] = session
+    session.store = self.store
+    session.changed()
+
+  def removeSession(self, session):
+    self.sessions.pop(session.key, None)
+    self.by_text_channel.pop(session.text_channel.id, None)
+    session.store = None
+    if self.store is not None:
+      self.store.ended(session.key)
+
+  async def restoreSession(self, saved):
+    """Rehydrate a saved session and bring voice mutes in line with it.
+
+    If the session can no longer run, unmute everyone it had muted.
+    """
+    key = (saved['guild'], saved['voice_channel'])
+    guild = self.bot.get_guild(saved['guild'])
+    if guild is None:
+      self.store.ended(key)
+      return
+    muted = [m for m in map(guild.get_member, saved['muted']) if m is not None]
+    voice_channel = guild.get_channel(saved['voice_channel'])
+    text_channel = guild.get_channel(saved['text_channel'])
+    host = guild.get_member(saved['host'])
+    if (None in (voice_channel, text_channel, host)
+        or key in self.sessions or text_channel.id in self.by_text_channel):
+      logging.warning('restoreSession(%s): unable to restore; unmute %d members', guild.name, len(muted))
+      await voice.bulk_mute(muted, False, self.MUTE_CONCURRENCY)
+      self.store.ended(key)
+      return
+
+    session = Session(host, text_channel, voice_channel, self.MUTE_CONCURRENCY)
+    session.running = State[saved['running']]
+    session.topic = saved['topic']
+    session.spoken.update({int(k): v for k, v in saved['spoken'].items()})
+    session.turn_limit = saved['turn_limit']
+    session.fair = saved['fair']
+    for member in map(guild.get_member, saved['queue']):
+      if member is not None:
+        session.enqueue(member)
+    if saved['active']:
+      session.active = guild.get_member(saved['active'])
+    session.muted = set(muted)
+    if saved['status_message']:
+      try:
+        session.output.status_message = await text_channel.fetch_message(saved['status_message'])
+      except discord.HTTPException:
+        pass
+    self.addSession(session)
+
+    # Unmute anyone that left while the bot was away. While running, everyone
+    # else but the active speaker should be muted.
+    present = session.present
+    for member in list(session.queue):
+      if member not in present:
+        session.dequeue(member)
+    # memberLeft never fires for a speaker that left while the bot was away.
+    left = session.active is not None and session.active not in present
+    if left:
+      session.send('%s left the voice channel.' % session.active.display_name)
+      session.active = None
+    await session.bulkMute([m for m in muted if m not in present], False)
+    if session.running == State.RUNNING:
+      await session.bulkMute([m for m in present if m != session.active])
+      if session.active:
+        await session.startTurn(session.active)
+      elif left:
+        await session.setActive()
+    session.send('Restored the discussion after a restart.')
+    session.updateStatus()
+
+  def voiceSession(self, channel):
+    """Return the session running in a voice channel, if any."""
+    if channel is None:
+      return None
+    return self.sessions.get((channel.guild.id, channel.id))
+
+  async def unmuteStray(self, member):
+    """Unmute a member that is muted outside of any discussion."""
+    if not member.voice or not member.voice.mute:
+      return
+    if not await voice.set_mute(member, False):
+      return
+    for session in self.sessions.values():
+      session.muted.discard(member)
+
   def assertIsModAndRunning(self, ctx):
     """Assert the queue is active and in this channel and the author is a mod."""
-    self.assertIsRunningChannel(ctx)
-    self.assertIsMod(ctx)
+    session = self.assertIsRunningChannel(ctx)
+    self.assertIsMod(ctx, session)
+    return session
 
-  def assertIsMod(self, ctx, member=None):
+  def assertIsMod(self, ctx, session, member=None):
     """Assert the author is a mod."""
     if member is None:
       member = ctx.author
-    if not self.isMod(member):
-      raise commands.checkfailure(
+    if not session.isMod(member):
+      raise commands.CheckFailure(
           '%s(%s): command may only be used by mods.',
           (ctx.command.name, member.display_name))
 
-  def assertNotPaused(self, ctx):
-    if self.running == State.PAUSED:
+  def assertNotPaused(self, ctx, session):
+    if session.running == State.PAUSED:
       raise commands.CheckFailure(
           '%s(%s): TalkQueue is paused.',
           (ctx.command.name, ctx.author.display_name))
 
   def assertIsRunningChannel(self, ctx):
-    """Assert the queue is active and in this channel."""
-    if not self.running:
+    """Assert a queue is active in this channel. Returns its session."""
+    session = self.by_text_channel.get(ctx.channel.id)
+    if session is None or not session.running:
       raise commands.CheckFailure(
-          '%s(%s): TalkQueue not active.',
-          (ctx.command.name, ctx.author.display_name))
-    if ctx.channel != self.text_channel:
-      raise commands.checkfailure(
-          '%s(%s): command not used in active channel.',
+          '%s(%s): TalkQueue not active in this channel.',
           (ctx.command.name, ctx.author.display_name))
+    return session
+
+  @commands.Cog.listener()
+  async def on_ready(self):
+    """Restore sessions saved before a restart."""
+    if self.restored or self.store is None or self.bot is None:
+      return
+    self.restored = True
+    await asyncio.gather(*(self.restoreSession(s) for s in self.store.load()))
 
   @commands.Cog.listener()
   async def on_error(self, event, *args, **kwargs):
@@ -181,47 +472,53 @@ class TalkQueue(commands.Cog):
 
   @commands.Cog.listener()
   async def on_voice_state_update(self, member, before, after):
-    """Manage server muting on changes.
+    """Track discussion channel presence and manage server muting on changes.
 
-    If someone enters the discussion channel mid-discussion, mute them.
-    If someone enters a channel and there is no discussion happening but
-    they are somehow muted (eg got muted and left), unmute them.
+    If someone enters a discussion channel mid-discussion, mute them.
+    If someone leaves a discussion channel, drop them from its queue.
+    If someone enters a channel and there is no discussion happening there
+    but they are somehow muted (eg got muted and left), unmute them.
     """
-    # Ignore unless this is a join.
-    if not (before.channel is None and after.channel is not None):
+    # Ignore anything but joins, leaves and moves.
+    if before.channel == after.channel:
       return
 
-    # Is muted on join
-    if after.mute:
-      # Discussion is not running or joined a different channel
-      if not self.running or after.channel != self.voice_channel:
-        await self.unmute(member)
+    left = self.voiceSession(before.channel)
+    joined = self.voiceSession(after.channel)
+
+    # Muted on joining a channel without a discussion, either fresh or
+    # straight from a discussion that muted them.
+    if after.channel is not None and after.mute and joined is None:
+      if before.channel is None or (left is not None and member in left.muted):
+        await self.unmuteStray(member)
 
-    if self.running and after.channel == self.voice_channel:
-      logging.info('%s joined voice; mute', member.display_name)
-      await self.mute(member)
+    if left is not None:
+      await left.memberLeft(member)
+    if joined is not None:
+      await joined.memberJoined(member)
 
   @commands.command(help=HELP_ADD)
   async def add(self, ctx, *args):
     """(mod) Add a member to the back of the queue."""
-    self.assertIsModAndRunning(ctx)
+    session = self.assertIsModAndRunning(ctx)
 
-    for member in ctx.message.mentions:
-      await self.addToQueue(ctx, member)
+    added = [m for m in ctx.message.mentions if await session.addToQueue(m)]
+    if added:
+      session.send('Added: %s.' % ', '.join(m.display_name for m in added))
 
   @commands.command(help=HELP_REMOVE)
   async def remove(self, ctx, *args):
     """(mod) Remove a member from the queue."""
-    self.assertIsModAndRunning(ctx)
+    session = self.assertIsModAndRunning(ctx)
 
     for member in ctx.message.mentions:
-      if member in self.queue:
-        del self.queue[self.queue.index(member)]
+      session.dequeue(member)
+    session.updateStatus()
 
   @commands.command(help=HELP_MOVE)
   async def move(self, ctx, *args):
     """(mod) Move a member to a specific spot in the queue."""
-    self.assertIsModAndRunning(ctx)
+    session = self.assertIsModAndRunning(ctx)
 
     if len(ctx.message.mentions) != 1:
       logging.warning('move(%s): must mention exactly one person.', ctx.message.content)
@@ -235,157 +532,200 @@ class TalkQueue(commands.Cog):
       return
 
     pos = int(parts[-1])
-    member = tx.message.mentions[0]
+    member = ctx.message.mentions[0]
 
-    if member in self.queue:
-      del self.queue[self.queue.index(member)]
+    session.dequeue(member)
 
-    await self.addToQueue(ctx, member, pos - 1)
+    await session.addToQueue(member, pos - 1)
 
   @commands.command(help=HELP_TOPIC)
   @commands.cooldown(1, 2, commands.BucketType.channel)
   async def topic(self, ctx, *args):
     """(mod) Set the topic."""
-    self.assertIsModAndRunning(ctx)
+    session = self.assertIsModAndRunning(ctx)
 
-    self.setTopic(ctx)
+    session.setTopic(ctx)
 
   @commands.command(help=HELP_ROUND)
   @commands.cooldown(1, 10, commands.BucketType.channel)
   async def round(self, ctx, *args):
     """(mod) Add everyone to the queue."""
-    self.assertIsModAndRunning(ctx)
+    session = self.assertIsModAndRunning(ctx)
 
-    for member in self.voice_channel.members:
-      if member not in self.queue and self.isMod(member):
-        self.queue.append(member)
-    for member in self.voice_channel.members:
-      if member not in self.queue:
-        self.queue.append(member)
-    await self.setActive(ctx)
+    for member in session.voice_channel.members:
+      if member not in session.queue and member != session.active and session.isMod(member):
+        session.enqueue(member)
+    for member in session.voice_channel.members:
+      if member not in session.queue and member != session.active:
+        session.enqueue(member)
+    await session.setActive()
+    session.updateStatus()
 
   @commands.command(help=HELP_START)
   async def start(self, ctx, *args):
     """Start a discussion."""
     member = ctx.author
-    if self.running:
-      logging.warning('Cannot start discusion; already running one.')
-      return
     if not member.voice:
-      await self.send(ctx, 'You must be in a voice channel to start a discussion.')
+      await ctx.send('You must be in a voice channel to start a discussion.')
+      return
+    if ctx.channel.id in self.by_text_channel:
+      logging.warning('Cannot start discusion; already running one in this channel.')
+      return
+    if self.voiceSession(member.voice.channel):
+      logging.warning('Cannot start discusion; already running one in that voice channel.')
       return
 
-    self.running = State.RUNNING
-    self.queue = []
-    self.active = None
-    self.topic = None
-    self.text_channel = ctx.channel
-    self.voice_channel = member.voice.channel
-    self.host = member
-
-    self.setTopic(ctx)
+    session = Session(member, ctx.channel, member.voice.channel, self.MUTE_CONCURRENCY)
+    session.setTopic(ctx)
+    self.addSession(session)
 
-    await self.send(ctx, 'Starting the discussion. Mute all members.')
-    for member in self.voice_channel.members:
-      await self.mute(member)
+    session.send('Starting the discussion. Mute all members.')
+    result = await session.bulkMute(session.voice_channel.members)
+    if result.failed:
+      session.send('Muting: %s.' % result)
+    session.updateStatus()
 
   @commands.command(help=HELP_END)
   async def end(self, ctx, *args):
     """End the discussion."""
-    self.assertIsModAndRunning(ctx)
+    session = self.assertIsModAndRunning(ctx)
 
-    self.running = State.STOPPED
+    session.running = State.STOPPED
+    self.removeSession(session)
     logging.info('Ending the discussion. Unmute everyone that I muted.')
-    for member in list(self.muted):
-      await self.unmute(member)
-    await self.send(ctx, 'The discussion is now closed.')
+    result = await session.bulkMute(session.muted, False)
+    session.send('The discussion is now closed.')
+    if result.failed:
+      session.send('Unmuting: %s.' % result)
+    await session.output.close()
 
   @commands.command(help=HELP_JOIN)
   async def join(self, ctx, *args):
     """Join yourself to the queue."""
-    self.assertIsRunningChannel(ctx)
-    await self.addToQueue(ctx, ctx.author)
+    session = self.assertIsRunningChannel(ctx)
+    # Members that go straight to active speaker get a prompt instead.
+    if await session.addToQueue(ctx.author) and ctx.author in session.queue:
+      session.send('Added: %s (position %d).' % (
+          ctx.author.display_name, session.position(ctx.author)))
 
   @commands.command(help=HELP_LEAVE)
   async def leave(self, ctx, *args):
     """Leave yourself from the queue."""
-    self.assertIsRunningChannel(ctx)
+    session = self.assertIsRunningChannel(ctx)
 
     member = ctx.author
-    if member not in self.queue:
+    if member not in session.queue:
       logging.info('leave(%s): member not in queue', member.display_name)
     else:
-      del self.queue[self.queue.index(member)]
-      self.send('Removed %s from the queue.' % member.display_name)
+      session.dequeue(member)
+      session.send('Removed %s from the queue.' % member.display_name)
+      session.updateStatus()
 
   @commands.command(help=HELP_NEXT)
   @commands.cooldown(1, 1, commands.BucketType.channel)
   async def next(self, ctx, *args):
     """Finish speaking and allow the next speaker."""
-    self.assertIsRunningChannel(ctx)
-    if self.running != State.RUNNING:
-      logging.info('next(): state %r; do nothing', self.running)
+    session = self.assertIsRunningChannel(ctx)
+    if session.running != State.RUNNING:
+      logging.info('next(): state %r; do nothing', session.running)
       return
 
     member = ctx.author
-    if not self.active:
-      return await self.send(ctx, 'There is no one in the queue.')
-    if self.active != member and not self.isMod(ctx.author):
-      return await self.send(ctx, '%s is not the active speaker' % member.display_name)
+    if not session.active:
+      return session.send('There is no one in the queue.')
+    if session.active != member and not session.isMod(ctx.author):
+      return session.send('%s is not the active speaker' % member.display_name)
 
     # Mute the active person that just did a !next
-    await self.mute(self.active)
-    logging.info('next(): mute %s', self.active.display_name)
-    self.active = None
-
-    await self.setActive(ctx)
+    await session.finishTurn()
+    await session.setActive()
 
   @commands.command(help=HELP_QUEUE)
   @commands.cooldown(1, 5, commands.BucketType.channel)
   async def queue(self, ctx, *args):
     """Display the queue."""
-    self.assertIsRunningChannel(ctx)
+    session = self.assertIsRunningChannel(ctx)
 
-    msg = self.getQueue(ctx.author, ' all' in ctx.message.content)
-    await self.send(ctx, msg)
+    msg = session.getQueue(ctx.author, ' all' in ctx.message.content)
+    session.send(msg)
 
   @commands.command(help=HELP_PAUSE)
   async def pause(self, ctx, *args):
     """(mods) Pause the queue, unmute mods."""
-    self.assertIsRunningChannel(ctx)
-    self.running = State.PAUSED
-    for member in list(self.muted):
-      if self.isMod(member):
-        await self.unmute(member)
-      else:
-        await self.mute(member)
+    session = self.assertIsRunningChannel(ctx)
+    session.running = State.PAUSED
+    session.recordTurn()
+    mods = [m for m in session.muted if session.isMod(m)]
+    await session.bulkMute(mods, False)
 
   @commands.command(help=HELP_OPEN)
   async def open(self, ctx, *args):
     """(mods) Pause the queue, unmute everyone."""
-    self.assertIsRunningChannel(ctx)
-    self.running = State.PAUSED
-    for member in list(self.muted):
-      await self.unmute(member)
+    session = self.assertIsRunningChannel(ctx)
+    session.running = State.PAUSED
+    session.recordTurn()
+    await session.bulkMute(session.muted, False)
 
   @commands.command(help=HELP_RESUME)
   async def resume(self, ctx, *args):
     """(mods) Resume the speaking queue."""
-    self.assertIsRunningChannel(ctx)
-    if self.running != State.PAUSED:
-      logging.info('resume(): state %r; do nothing', self.running)
+    session = self.assertIsRunningChannel(ctx)
+    if session.running != State.PAUSED:
+      logging.info('resume(): state %r; do nothing', session.running)
       return
-    for member in self.voice_channel.members:
-      await self.mute(member)
-    if self.active:
-      a, self.active = self.active, None
-      self.addToQueue(ctx, a, 0)
-    self.running = State.RUNNING
+    await session.bulkMute([m for m in session.present if m != session.active])
+    session.running = State.RUNNING
+    if session.active:
+      await session.startTurn(session.active)
+    session.updateStatus()
+
+  @commands.command(help=HELP_FAIR)
+  async def fair(self, ctx, *args):
+    """(mods) Toggle fair-share ordering of the queue."""
+    session = self.assertIsModAndRunning(ctx)
+    words = ctx.message.content.split()
+    if len(words) != 2 or words[1] not in ('on', 'off'):
+      return session.send('Usage: !fair on|off')
+    session.fair = words[1] == 'on'
+    session.send('Fair-share ordering is %s.' % words[1])
+    session.updateStatus()
+
+  @commands.command(help=HELP_TIMELIMIT)
+  async def timelimit(self, ctx, *args):
+    """(mods) Set or clear the per-turn time limit."""
+    session = self.assertIsModAndRunning(ctx)
+    words = ctx.message.content.split()
+    if len(words) != 2 or not (words[1] == 'off' or words[1].isnumeric()):
+      return session.send('Usage: !timelimit <seconds>|off')
+    session.turn_limit = int(words[1]) if words[1] != 'off' and int(words[1]) else None
+    if session.turn_limit:
+      session.send('Turns are limited to %d seconds, starting with the next speaker.' % session.turn_limit)
+    else:
+      session.send('Turns are not time limited.')
+    session.changed()
+
+  @commands.command(help=HELP_TALKTIME)
+  @commands.cooldown(1, 5, commands.BucketType.channel)
+  async def talktime(self, ctx, *args):
+    """List how long people have spoken, longest first."""
+    session = self.assertIsRunningChannel(ctx)
+    spoken = collections.Counter(session.spoken)
+    if session.active and session.turn_started is not None:
+      spoken[session.active.id] += time.monotonic() - session.turn_started
+    if not spoken:
+      return session.send('No one has spoken yet.')
+    guild = session.voice_channel.guild
+    times = []
+    for member_id, seconds in spoken.most_common(10):
+      member = guild.get_member(member_id)
+      name = member.display_name if member else str(member_id)
+      times.append('%s %d:%02d' % (name, seconds // 60, seconds % 60))
+    session.send('Talk time: %s' % ', '.join(times))
 
 
 def main():
   bot = commands.Bot(command_prefix='!')
-  bot.add_cog(TalkQueue())
+  bot.add_cog(TalkQueue(bot))
   bot.run(os.getenv('DISCORD_TOKEN'))
 
 
@@ -0,0 +1,83 @@
+#!/bin/python
+
+import asyncio
+import discord
+import logging
+from dataclasses import dataclass, field
+
+
+@dataclass
+class BulkResult:
+  """Outcome of a bulk voice state change."""
+  succeeded: list = field(default_factory=list)
+  failed: list = field(default_factory=list)
+  skipped: list = field(default_factory=list)
+
+  def __str__(self):
+    return '%d succeeded, %d failed, %d skipped' % (
+        len(self.succeeded), len(self.failed), len(self.skipped))
+
+  def extend(self, other):
+    self.succeeded.extend(other.succeeded)
+    self.failed.extend(other.failed)
+    self.skipped.extend(other.skipped)
+
+
+# Tries at a voice state edit before giving up, and the wait before the
+# first retry when rate limited without a Retry-After; doubled on each retry.
+EDIT_TRIES = 5
+RATE_LIMIT_WAIT = 1.0
+
+
+def _retry_after(error, default):
+  """Seconds Discord asked us to wait, if it said."""
+  try:
+    return float(error.response.headers['Retry-After'])
+  except (AttributeError, KeyError, TypeError, ValueError):
+    return default
+
+
+async def set_mute(member, mute):
+  """Server (un)mute a member. Returns whether the edit went through.
+
+  This is the one place the discussion queue changes voice state; rate
+  limited edits wait as long as Discord asks, or a doubling delay if it
+  does not say, and are tried up to EDIT_TRIES times.
+  """
+  wait = RATE_LIMIT_WAIT
+  for tries_left in range(EDIT_TRIES - 1, -1, -1):
+    try:
+      await member.edit(mute=mute)
+      return True
+    except discord.HTTPException as e:
+      if e.status != 429 or not tries_left:
+        logging.warning('Could not %s %s: %s', 'mute' if mute else 'unmute', member.display_name, e)
+        return False
+      pause = _retry_after(e, wait)
+      wait *= 2
+    logging.info('Rate limited changing voice for %s; waiting %.1fs', member.display_name, pause)
+    await asyncio.sleep(pause)
+  return False
+
+
+async def bulk_mute(members, mute, concurrency=10):
+  """Server (un)mute members concurrently, at most `concurrency` edits at a time.
+
+  Members not in voice or already in the requested state are skipped.
+  """
+  result = BulkResult()
+  sem = asyncio.Semaphore(concurrency)
+
+  async def edit(member):
+    if not member.voice or member.voice.mute == mute:
+      result.skipped.append(member)
+      return
+    async with sem:
+      ok = await set_mute(member, mute)
+    (result.succeeded if ok else result.failed).append(member)
+
+  await asyncio.gather(*(edit(m) for m in members))
+  return result
+
+
+# vim:ts=2:sw=2:expandtab
@@ -0,0 +1,88 @@
+#!/bin/python
+
+import datetime
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Classification:
+  """Guild members bucketed by activity."""
+  active: list = field(default_factory=list)
+  inactive: list = field(default_factory=list)
+  never_spoke: list = field(default_factory=list)
+  # Never spoke and joined before the stale cutoff.
+  stale: list = field(default_factory=list)
+  # Inactive and never spoke members that hold the member role.
+  inactive_w_role: list = field(default_factory=list)
+  never_spoke_wr: list = field(default_factory=list)
+
+  @property
+  def drops(self):
+    return self.inactive_w_role + self.never_spoke_wr
+
+
+def classify(members, role_member_ids, seen, active_ids, stale_cutoff):
+  """Bucket members in a single pass.
+
+  Args:
+    members: the guild members.
+    role_member_ids: ids of members holding the member role.
+    seen: ids of members with any recorded activity.
+    active_ids: ids of members active since the inactivity cutoff.
+    stale_cutoff: members that never spoke and joined before this are stale.
+  """
+  c = Classification()
+  for m in members:
+    if m.id in active_ids:
+      c.active.append(m)
+      continue
+    has_role = m.id in role_member_ids
+    if m.id in seen:
+      c.inactive.append(m)
+      if has_role:
+        c.inactive_w_role.append(m)
+      continue
+    c.never_spoke.append(m)
+    if has_role:
+      c.never_spoke_wr.append(m)
+    if m.joined_at is not None and m.joined_at < stale_cutoff:
+      c.stale.append(m)
+  return c
+
+
+@dataclass
+class FakeMember:
+  id: int
+  joined_at: datetime.datetime
+
+
+def main():
+  """Benchmark classify() over a synthetic guild."""
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+  rand = random.Random(0)
+  now = datetime.datetime.now()
+  members = [
+      FakeMember(i, now - datetime.timedelta(days=rand.randrange(365)))
+      for i in range(count)]
+  role_member_ids = {m.id for m in members if rand.random() < 0.7}
+  seen = {m.id for m in members if rand.random() < 0.6}
+  active_ids = {i for i in seen if rand.random() < 0.5}
+  stale_cutoff = now - datetime.timedelta(days=30)
+
+  runs = 10
+  start = time.perf_counter()
+  for _ in range(runs):
+    c = classify(members, role_member_ids, seen, active_ids, stale_cutoff)
+  elapsed = (time.perf_counter() - start) / runs
+  print('%d members: %.1f ms per classify (%d active, %d inactive, %d never spoke, %d stale, %d drops)' % (
+      count, elapsed * 1000, len(c.active), len(c.inactive), len(c.never_spoke),
+      len(c.stale), len(c.drops)))
+
+
+if __name__ == '__main__':
+  main()
+
+# vim:ts=2:sw=2:expandtab
@@ -0,0 +1,363 @@
+#!/bin/python
+
+import array
+import asyncio
+import concurrent.futures
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+
+try:
+  from ..common import journal
+except ImportError:
+  # bot.py runs from the repository root, where the cogs are top-level packages.
+  from common import journal
+
+# Binary history export: a header of magic, version and record count, followed
+# by `count` little-endian uint64 member ids then `count` uint32 timestamps.
+BINARY_MAGIC = b'PHST'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sIQ')
+
+
+class HistoryLog:
+  """Member last-seen times, persisted as a JSON snapshot plus an append-only log.
+
+  This is the original backend. History is a single flat map shared by all
+  guilds; the guild_id arguments are accepted for compatibility with other
+  backends and ignored. Snapshots in the binary format are read too, so
+  switching back from the binary backend keeps the history.
+
+  Updates are appended to the log as `member_id timestamp` lines so a save
+  only costs as much as the entries that changed. Compaction folds the log
+  back into the snapshot, which is written to a temp file and renamed into
+  place so a crash mid-write never loses history.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.journal = journal.Journal(filename)
+    # channel id => newest message id scanned by build_hist.
+    self.checkpoint_filename = filename + '.channels'
+    self.checkpoints = {}
+    self.history = {}
+    self.dirty = {}
+    # Serializes snapshot writes.
+    self._lock = asyncio.Lock()
+    # The snapshot compact_async is writing in a worker thread, if any.
+    self._writing = None
+    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    self.load()
+
+  def count(self, guild_id):
+    return len(self.history)
+
+  def get(self, guild_id, member_id, default=None):
+    return self.history.get(member_id, default)
+
+  def seen(self, guild_id):
+    """Return the ids of all members with any recorded activity."""
+    return set(self.history)
+
+  def active_since(self, guild_id, cutoff):
+    """Return the ids of members seen after cutoff."""
+    return {m for m, ts in self.history.items() if ts > cutoff}
+
+  def items(self, guild_id):
+    """Return {member_id: ts} for the guild."""
+    return dict(self.history)
+
+  def load(self):
+    """Load the snapshot then replay any logs over it."""
+    self.history = {}
+    self.dirty = {}
+    if os.path.exists(self.filename):
+      try:
+        self.history = self._read_snapshot()
+      except Exception:
+        logging.exception('Failed to load history snapshot %s', self.filename)
+        self.history = {}
+    self.journal.drop_stale()
+    for line in self.journal.replay():
+      parts = line.split()
+      if len(parts) != 2 or not all(p.isdigit() for p in parts):
+        logging.warning('Skipping malformed history log line: %r', line)
+        continue
+      member_id, ts = (int(p) for p in parts)
+      self.history[member_id] = max(ts, self.history.get(member_id, 0))
+    if os.path.exists(self.checkpoint_filename):
+      with open(self.checkpoint_filename, 'rt') as f:
+        self.checkpoints = {int(k): v for k, v in json.load(f).items()}
+
+  def _read_snapshot(self):
+    with open(self.filename, 'rb') as f:
+      binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if binary:
+      return read_binary(self.filename)
+    with open(self.filename, 'rt') as f:
+      return {int(k): v for k, v in json.load(f).items()}
+
+  def record(self, guild_id, member_id, ts):
+    """Record a member as seen at ts. Returns True if the member is new."""
+    first = member_id not in self.history
+    self.history[member_id] = ts
+    self.dirty[member_id] = ts
+    return first
+
+  def update(self, guild_id, entries):
+    """Merge {member_id: ts} into the history, keeping the latest timestamp."""
+    newer = {m: ts for m, ts in entries.items() if ts > self.history.get(m, 0)}
+    self.history.update(newer)
+    self.dirty.update(newer)
+
+  def get_checkpoint(self, channel_id):
+    """Return the newest scanned message id of a channel, if any."""
+    return self.checkpoints.get(channel_id)
+
+  def set_checkpoint(self, channel_id, message_id):
+    self.checkpoints[channel_id] = message_id
+    self._write_json(self.checkpoint_filename, self.checkpoints)
+
+  def flush(self):
+    """Append all changed entries to the log."""
+    if not self.dirty:
+      return
+    self.journal.append(''.join('%d %d\n' % i for i in self.dirty.items()))
+    self.dirty = {}
+
+  def _write_json(self, filename, data):
+    tmp = filename + '.tmp'
+    with open(tmp, 'wt') as f:
+      json.dump(data, f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+  def _write_snapshot(self, history):
+    self.journal.write_snapshot(lambda f: json.dump(history, f))
+
+  def _rotate(self):
+    """Flush and move the log aside. Returns a copy of the history to snapshot."""
+    self.flush()
+    self.journal.rotate()
+    return dict(self.history)
+
+  def compact(self):
+    """Synchronously fold the log into a fresh snapshot.
+
+    First waits for any snapshot compact_async is still writing: cancelling
+    compact_async does not stop its thread, which writes the same temp file
+    and removes the same old log.
+    """
+    if self._writing is not None:
+      concurrent.futures.wait([self._writing])
+    self._write_snapshot(self._rotate())
+
+  async def compact_async(self):
+    """Fold the log into a fresh snapshot, writing the snapshot in a worker thread.
+
+    Updates made while the snapshot is being written go to a new log.
+    """
+    async with self._lock:
+      history = self._rotate()
+      self._writing = self._executor.submit(self._write_snapshot, history)
+      await asyncio.wrap_future(self._writing)
+
+
+class BinaryHistory(HistoryLog):
+  """HistoryLog with the snapshot in the binary format. The default backend.
+
+  Loading reads the id and timestamp columns straight into arrays rather
+  than parsing JSON and converting every key back to an int, and the file
+  is about a third the size. A JSON snapshot is still read, and replaced
+  by a binary one at the next compaction.
+  """
+
+  def _write_snapshot(self, history):
+    self.journal.write_snapshot(lambda f: _pack(f, history), mode='wb')
+
+
+class SqliteHistory:
+  """Member last-seen times per guild, stored in SQLite.
+
+  Rows are keyed on (guild_id, member_id) and indexed on last_seen so that
+  activity cutoffs are answered by index range scans rather than by holding
+  the whole history in memory. Writes are batched into a transaction which
+  is committed on flush().
+  """
+
+  SCHEMA = """
+    CREATE TABLE IF NOT EXISTS history (
+      guild_id INTEGER NOT NULL,
+      member_id INTEGER NOT NULL,
+      last_seen INTEGER NOT NULL,
+      PRIMARY KEY (guild_id, member_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS history_last_seen ON history (guild_id, last_seen);
+    CREATE TABLE IF NOT EXISTS checkpoints (
+      channel_id INTEGER PRIMARY KEY,
+      message_id INTEGER NOT NULL
+    );
+  """
+  UPSERT = """
+    INSERT INTO history (guild_id, member_id, last_seen) VALUES (?, ?, ?)
+    ON CONFLICT (guild_id, member_id)
+    DO UPDATE SET last_seen = max(last_seen, excluded.last_seen)
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.db = sqlite3.connect(filename)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('PRAGMA synchronous=NORMAL')
+    self.db.executescript(self.SCHEMA)
+
+  def count(self, guild_id):
+    return self.db.execute(
+        'SELECT count(*) FROM history WHERE guild_id = ?', (guild_id,)).fetchone()[0]
+
+  def get(self, guild_id, member_id, default=None):
+    row = self.db.execute(
+        'SELECT last_seen FROM history WHERE guild_id = ? AND member_id = ?',
+        (guild_id, member_id)).fetchone()
+    return default if row is None else row[0]
+
+  def seen(self, guild_id):
+    """Return the ids of all members with any recorded activity."""
+    rows = self.db.execute('SELECT member_id FROM history WHERE guild_id = ?', (guild_id,))
+    return {r[0] for r in rows}
+
+  def active_since(self, guild_id, cutoff):
+    """Return the ids of members seen after cutoff."""
+    rows = self.db.execute(
+        'SELECT member_id FROM history WHERE guild_id = ? AND last_seen > ?',
+        (guild_id, cutoff))
+    return {r[0] for r in rows}
+
+  def items(self, guild_id):
+    """Return {member_id: ts} for the guild."""
+    return dict(self.db.execute(
+        'SELECT member_id, last_seen FROM history WHERE guild_id = ?', (guild_id,)))
+
+  def record(self, guild_id, member_id, ts):
+    """Record a member as seen at ts. Returns True if the member is new."""
+    first = self.get(guild_id, member_id) is None
+    self.db.execute(self.UPSERT, (guild_id, member_id, ts))
+    return first
+
+  def update(self, guild_id, entries):
+    """Merge {member_id: ts} into the history, keeping the latest timestamp."""
+    self.db.executemany(self.UPSERT, ((guild_id, m, ts) for m, ts in entries.items()))
+
+  def get_checkpoint(self, channel_id):
+    """Return the newest scanned message id of a channel, if any."""
+    row = self.db.execute(
+        'SELECT message_id FROM checkpoints WHERE channel_id = ?', (channel_id,)).fetchone()
+    return None if row is None else row[0]
+
+  def set_checkpoint(self, channel_id, message_id):
+    with self.db:
+      self.db.execute(
+          'INSERT OR REPLACE INTO checkpoints (channel_id, message_id) VALUES (?, ?)',
+          (channel_id, message_id))
+
+  def flush(self):
+    """Commit pending writes."""
+    self.db.commit()
+
+  def compact(self):
+    """Commit and fold the SQLite WAL back into the database file."""
+    self.flush()
+    self.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+  async def compact_async(self):
+    self.compact()
+
+
+BACKENDS = {
+  'binary': BinaryHistory,
+  'json': HistoryLog,
+  'sqlite': SqliteHistory,
+}
+
+
+def open_history(filename, backend='binary'):
+  """Open a history store using the named backend."""
+  if backend not in BACKENDS:
+    raise ValueError('Unknown history backend %r; expected one of %s' % (
+        backend, ', '.join(BACKENDS)))
+  return BACKENDS[backend](filename)
+
+
+def _columns():
+  ids = array.array('Q')
+  stamps = array.array('I')
+  assert ids.itemsize == 8 and stamps.itemsize == 4
+  return ids, stamps
+
+
+def _pack(f, entries):
+  ids, stamps = _columns()
+  ids.extend(entries.keys())
+  stamps.extend(entries.values())
+  if sys.byteorder != 'little':
+    ids.byteswap()
+    stamps.byteswap()
+  f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(entries)))
+  ids.tofile(f)
+  stamps.tofile(f)
+
+
+def write_binary(filename, entries):
+  """Write {member_id: ts} to filename in the binary history format."""
+  tmp = filename + '.tmp'
+  with open(tmp, 'wb') as f:
+    _pack(f, entries)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp, filename)
+
+
+def read_binary(filename):
+  """Read {member_id: ts} from a file in the binary history format."""
+  with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+    if len(mm) < BINARY_HEADER.size:
+      raise ValueError('%s is too short to be a history file' % filename)
+    magic, version, count = BINARY_HEADER.unpack_from(mm)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+      raise ValueError('%s is not a version %d history file' % (filename, BINARY_VERSION))
+    ids, stamps = _columns()
+    start = BINARY_HEADER.size
+    end = start + count * (ids.itemsize + stamps.itemsize)
+    if len(mm) < end:
+      raise ValueError('%s is truncated' % filename)
+    mid = start + count * ids.itemsize
+    # Slicing a memoryview copies nothing; frombytes reads straight from the map.
+    with memoryview(mm) as view:
+      ids.frombytes(view[start:mid])
+      stamps.frombytes(view[mid:end])
+  if sys.byteorder != 'little':
+    ids.byteswap()
+    stamps.byteswap()
+  return dict(zip(ids, stamps))
+
+
+def main():
+  """Convert a JSON history (snapshot plus log) to the binary format."""
+  if len(sys.argv) != 3:
+    print('Usage: %s history.json history.bin' % sys.argv[0])
+    sys.exit(1)
+  src, dst = sys.argv[1:]
+  entries = HistoryLog(src).items(None)
+  write_binary(dst, entries)
+  print('Wrote %d entries to %s' % (len(entries), dst))
+
+
+if __name__ == '__main__':
+  main()
+
+# vim:ts=2:sw=2:expandtab
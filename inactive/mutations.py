@@ -0,0 +1,118 @@
+#!/bin/python
+
+import asyncio
+import collections
+import discord
+import logging
+from dataclasses import dataclass
+
+
+@dataclass
+class Mutation:
+  """A pending change to a member: add or remove a role, or kick."""
+  member: discord.Member
+  action: str
+  role: discord.Role = None
+
+  def key(self):
+    """Mutations with the same key replace each other while pending.
+
+    User ids are the same in every guild, so kicks from different guilds
+    must not share a key.
+    """
+    return (self.member.guild.id, self.member.id, self.role.id if self.role else self.action)
+
+  async def apply(self):
+    if self.action == 'add_role':
+      if self.role not in self.member.roles:
+        await self.member.add_roles(self.role)
+    elif self.action == 'remove_role':
+      if self.role in self.member.roles:
+        await self.member.remove_roles(self.role)
+    elif self.action == 'kick':
+      await self.member.kick()
+    else:
+      raise ValueError('Unknown action %r' % self.action)
+
+
+class MutationQueue:
+  """Apply member mutations in the background with a bounded number of workers.
+
+  Pending mutations are deduplicated per guild, member and role (or per guild
+  and member for kicks); a newer mutation replaces an older pending one. Rate limited
+  requests are retried with exponential backoff.
+  """
+
+  def __init__(self, workers=5, retries=5, backoff=1.0):
+    self.worker_count = workers
+    self.retries = retries
+    self.backoff = backoff
+    self.pending = {}
+    self.queue = asyncio.Queue()
+    self.workers = []
+    # Running totals: queued, done, failed, deduped.
+    self.stats = collections.Counter()
+
+  def start(self):
+    if self.workers:
+      return
+    self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+
+  def stop(self):
+    for w in self.workers:
+      w.cancel()
+    self.workers = []
+
+  def enqueue(self, mutation):
+    self.start()
+    key = mutation.key()
+    if key in self.pending:
+      self.stats['deduped'] += 1
+    else:
+      self.queue.put_nowait(key)
+    self.pending[key] = mutation
+    self.stats['queued'] += 1
+
+  def add_role(self, member, role):
+    self.enqueue(Mutation(member, 'add_role', role))
+
+  def remove_role(self, member, role):
+    self.enqueue(Mutation(member, 'remove_role', role))
+
+  def kick(self, member):
+    self.enqueue(Mutation(member, 'kick'))
+
+  async def join(self):
+    """Wait until all pending mutations are applied."""
+    await self.queue.join()
+
+  async def worker(self):
+    while True:
+      key = await self.queue.get()
+      try:
+        mutation = self.pending.pop(key, None)
+        if mutation is not None:
+          await self.run(mutation)
+      finally:
+        self.queue.task_done()
+
+  async def run(self, mutation):
+    for attempt in range(self.retries):
+      try:
+        await mutation.apply()
+        self.stats['done'] += 1
+        return
+      except discord.HTTPException as e:
+        if e.status != 429:
+          logging.warning('%s(%s) failed: %s', mutation.action, mutation.member, e)
+          break
+        delay = self.backoff * 2 ** attempt
+        logging.info('%s(%s) rate limited; retry in %.1fs', mutation.action, mutation.member, delay)
+        await asyncio.sleep(delay)
+      except Exception:
+        logging.exception('%s(%s) failed', mutation.action, mutation.member)
+        break
+    self.stats['failed'] += 1
+
+
+# vim:ts=2:sw=2:expandtab
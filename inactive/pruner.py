@@ -1,104 +1,266 @@
 #!/bin/python
 
-import collections
+import asyncio
 import datetime
 import discord
 import enum
-import json
 import logging
-import more_itertools
 import os
 import sys
 import time
 
+from dataclasses import dataclass, field
 from discord.ext import commands
+from discord.ext import tasks
+
+try:
+  from ..common import heap
+except ImportError:
+  # bot.py runs from the repository root, where the cogs are top-level packages.
+  from common import heap
+
+from . import classify
+from . import history
+from . import mutations
 
 DEBUG = False
 if DEBUG: import conf
 
+# Discord's maximum message length.
+MESSAGE_LIMIT = 2000
+
 
 async def is_owner(ctx):
   return ctx.guild and ctx.guild.owner == ctx.author
 
 
+def pack_messages(parts, tail=None, limit=MESSAGE_LIMIT, sep=', '):
+  """Greedily join parts into as few messages of at most limit chars as possible.
+
+  If given, tail is added to the last message as `parts: tail` when it fits,
+  or else sent as a message of its own.
+  """
+  messages = []
+  current = ''
+  for part in parts:
+    if len(part) > limit:
+      raise ValueError('Part is longer than the message limit: %r' % part)
+    if not current:
+      current = part
+    elif len(current) + len(sep) + len(part) <= limit:
+      current += sep + part
+    else:
+      messages.append(current)
+      current = part
+  if tail:
+    if current and len(current) + 2 + len(tail) <= limit:
+      current += ': ' + tail
+    else:
+      if current:
+        messages.append(current)
+      current = tail
+  if current:
+    messages.append(current)
+  return messages
+
+
+@dataclass
+class GuildState:
+  """Resolved config and cached membership for a configured guild."""
+  welcome_channel: discord.TextChannel
+  role: discord.Role
+  inactive_days: int
+  kick_days: int
+  # Whether auto_prune removes the member role without an owner's !prune.
+  auto_prune: bool = False
+  # Ids of members holding the member role; kept in sync by on_member_update.
+  members: set = field(default_factory=set)
+  # Members already recorded during the current touch window.
+  touched: set = field(default_factory=set)
+  touch_window: int = 0
+
+
 class Pruner(commands.Cog):
   """Member management to remove inactive and grant access on activity."""
 
   qualified_name = 'Prune Inactive Accounts'
 
   # How many days since last activity before being deemed inactive.
+  # Defaults; guilds may override these in the config.
   PRUNE_INACTIVE_TIMEOUT = 21
   PRUNE_KICK_TIMEOUT = 30
+  # How often to remove the member role from members that became inactive.
+  AUTO_PRUNE_INTERVAL_MINUTES = 10
+  # Seconds before auto_prune tries again to remove a role it failed to remove.
+  AUTO_PRUNE_RETRY = 60 * 60
+  # How often to fold the history log into the snapshot.
+  COMPACT_INTERVAL_HOURS = 6
+  # build_hist: channels scanned at once, messages read from an unscanned
+  # channel, messages between checkpoints and seconds between progress updates.
+  BUILD_HIST_CONCURRENCY = 4
+  BUILD_HIST_LIMIT = 10000
+  CHECKPOINT_INTERVAL = 1000
+  PROGRESS_INTERVAL = 5
+  # Concurrent workers applying role changes and kicks.
+  MUTATION_WORKERS = 5
+  # Activity is recorded at most once per member per this many seconds.
+  TOUCH_WINDOW = 60
+  # Seconds between consecutive messages sent by ping_nonmembers.
+  PING_INTERVAL = 1
 
   def __init__(self, bot, config):
     super(Pruner, self).__init__()
     self.bot = bot
     self.config = config
 
-    self._role = {}
-    self._welcome_channel = {}
+    # guild id => GuildState
+    self._guilds = {}
+    # (guild id, member id) => when the member becomes inactive.
+    self.expiry = heap.LazyHeap()
 
+    self.mutations = mutations.MutationQueue(self.MUTATION_WORKERS)
     self.load_history()
     self.next_save = int(time.time()) + 60 * 60
+    self.compact_history.start()
+    self.auto_prune.start()
 
   def cog_unload(self):
-    self.save_history()
+    self.compact_history.cancel()
+    self.auto_prune.cancel()
+    self.mutations.stop()
+    self.history.compact()
 
   def history_file(self):
     return os.getenv('PRUNER_HISTFILE')
 
+  def history_backend(self):
+    return os.getenv('PRUNER_HISTBACKEND', 'binary')
+
   def load_history(self):
-    if not os.path.exists(self.history_file()):
-      self.history = {}
-      return
-    with open(self.history_file(), 'rt') as f:
-      try:
-        self.history = {int(k): v for k, v in json.load(f).items()}
-      except Exception:
-        self.history = {}
+    self.history = history.open_history(self.history_file(), self.history_backend())
 
   def save_history(self):
-    with open(self.history_file(), 'wt') as f:
-      json.dump(self.history, f)
+    """Append changed entries to the history log."""
+    self.history.flush()
     self.next_save = int(time.time()) + 60 * 60
 
+  @tasks.loop(hours=COMPACT_INTERVAL_HOURS)
+  async def compact_history(self):
+    """Periodically fold the history log into the snapshot."""
+    await self.history.compact_async()
+
+  @compact_history.before_loop
+  async def before_compact_history(self):
+    await self.bot.wait_until_ready()
+
+  @tasks.loop(minutes=AUTO_PRUNE_INTERVAL_MINUTES)
+  async def auto_prune(self):
+    """Remove the member role from members whose inactivity window just expired."""
+    now = int(time.time())
+    for guild_id, member_id in self.expiry.pop_until(now):
+      state = self._guilds.get(guild_id)
+      if state is None or member_id not in state.members:
+        continue
+      member = state.role.guild.get_member(member_id)
+      if member is None:
+        continue
+      logging.info('auto_prune: %s is inactive; remove %s', member.display_name, state.role.name)
+      # Re-armed until on_member_update sees the role gone, so a failed removal is retried.
+      self.expiry.set((guild_id, member_id), now + self.AUTO_PRUNE_RETRY)
+      self.mutations.remove_role(member, state.role)
+
+  @auto_prune.before_loop
+  async def before_auto_prune(self):
+    await self.bot.wait_until_ready()
+
+  def inactive_timeout(self, guild):
+    """Seconds without activity before a member of the guild is inactive."""
+    return self._guilds[guild.id].inactive_days * 60 * 60 * 24
+
+  def track_expiry(self, guild, member_id, last_seen):
+    if not self._guilds[guild.id].auto_prune:
+      return
+    self.expiry.set((guild.id, member_id), last_seen + self.inactive_timeout(guild))
+
+  def load_expiry(self, guild):
+    """Track when each member holding the member role becomes inactive.
+
+    Members that never spoke are given one inactivity window from when they joined.
+    Only done for guilds that opted in to auto_prune.
+    """
+    if not self._guilds[guild.id].auto_prune:
+      return
+    for m in self._guilds[guild.id].role.members:
+      last_seen = self.history.get(guild.id, m.id)
+      if last_seen is None:
+        if m.joined_at is None:
+          continue
+        last_seen = int(m.joined_at.replace(tzinfo=datetime.timezone.utc).timestamp())
+      self.track_expiry(guild, m.id, last_seen)
+
   def get_nonmembers(self, guild):
-    r = self._role[guild]
-    return [m for m in guild.members if r not in m.roles]
+    members = self._guilds[guild.id].members
+    return [m for m in guild.members if m.id not in members]
 
   def ignore_guild(self, g_obj):
-    return g_obj.guild not in self._welcome_channel
+    return g_obj.guild is None or g_obj.guild.id not in self._guilds
 
   def member_role(self, g_obj):
-    return self._role[g_obj.guild]
+    return self._guilds[g_obj.guild.id].role
 
   async def welcome(self, g_obj, msg):
     """Send a message to the guild welcome channel, if configured."""
-    guild = g_obj.guild
     if self.ignore_guild(g_obj):
       return
-    await self._welcome_channel[guild].send(msg)
+    await self._guilds[g_obj.guild.id].welcome_channel.send(msg)
 
   @commands.Cog.listener()
   async def on_ready(self):
     """On ready, find the welcome channels and member roles for all the connected guilds."""
-    self._welcome_channel = {}
+    self._guilds = {}
     for g in self.bot.guilds:
       if g.name not in self.config: continue
 
-      c_name, r_name = self.config[g.name]
+      # (welcome channel, member role[, inactive days[, kick days[, auto prune]]])
+      c_name, r_name, *options = self.config[g.name]
+      inactive_days = options[0] if len(options) > 0 else self.PRUNE_INACTIVE_TIMEOUT
+      kick_days = options[1] if len(options) > 1 else self.PRUNE_KICK_TIMEOUT
+      auto_prune = bool(options[2]) if len(options) > 2 else False
 
-      cs = [c for c in g.text_channels if c.name == c_name]
-      if not cs: continue
-      c = cs[0]
+      c = discord.utils.get(g.text_channels, name=c_name)
+      if c is None: continue
       if not c.permissions_for(g.me).manage_roles: continue
 
-      roles = [r for r in g.roles if r.name == r_name]
-      if not roles: continue
-      r = roles[0]
+      r = discord.utils.get(g.roles, name=r_name)
+      if r is None: continue
 
-      self._welcome_channel[g] = c
-      self._role[g] = r
+      self._guilds[g.id] = GuildState(
+          welcome_channel=c, role=r, inactive_days=inactive_days, kick_days=kick_days,
+          auto_prune=auto_prune,
+          members={m.id for m in r.members})
+      self.load_expiry(g)
+
+  @commands.Cog.listener()
+  async def on_member_update(self, before, after):
+    """Keep the cached set of member role holders and their expiry in sync."""
+    state = self._guilds.get(after.guild.id)
+    if state is None:
+      return
+    if state.role in after.roles:
+      if after.id not in state.members:
+        state.members.add(after.id)
+        # A new holder gets a full inactivity window, even if given the role by hand.
+        self.track_expiry(after.guild, after.id, int(time.time()))
+    else:
+      state.members.discard(after.id)
+      self.expiry.discard((after.guild.id, after.id))
+
+  @commands.Cog.listener()
+  async def on_member_remove(self, member):
+    state = self._guilds.get(member.guild.id)
+    if state is not None:
+      state.members.discard(member.id)
+      self.expiry.discard((member.guild.id, member.id))
 
   @commands.Cog.listener()
   async def on_member_join(self, member):
@@ -110,21 +272,28 @@ class Pruner(commands.Cog):
 
   @commands.Cog.listener()
   async def on_message(self, message):
-    if self.ignore_guild(message): return
-    role = self.member_role(message)
+    if not message.guild: return  # Direct message.
+    state = self._guilds.get(message.guild.id)
+    if state is None: return
 
-    if (not message.guild  # Direct message.
-        or message.is_system()
-        or isinstance(message.author, discord.User)):
+    now = int(time.time())
+    window = now - now % self.TOUCH_WINDOW
+    if window != state.touch_window:
+      state.touch_window = window
+      state.touched = set()
+    m_id = message.author.id
+    if m_id in state.touched and m_id in state.members:
       return
 
-    m_id = message.author.id
-    now = int(time.time())
-    first = m_id not in self.history
-    self.history[m_id] = now
+    if message.is_system() or isinstance(message.author, discord.User):
+      return
+    state.touched.add(m_id)
+
+    first = self.history.record(message.guild.id, m_id, now)
+    self.track_expiry(message.guild, m_id, now)
 
-    if role not in message.author.roles:
-      await message.author.add_roles(role)
+    if m_id not in state.members:
+      self.mutations.add_role(message.author, state.role)
 
     if first or now > self.next_save:
       self.save_history()
@@ -142,89 +311,106 @@ class Pruner(commands.Cog):
   async def ping_nonmembers(self, ctx, *args):
     if self.ignore_guild(ctx): return
     msg = ctx.message.content[len(ctx.prefix + ctx.invoked_with):].strip()
-    if len(msg) >= 2000:
-      await ctx.send('Message len is too big. %d > 2000. Fail.' % len(msg))
+    if len(msg) > MESSAGE_LIMIT:
+      await ctx.send('Message len is too big. %d > %d. Fail.' % (len(msg), MESSAGE_LIMIT))
       return
 
     nonmembers = self.get_nonmembers(ctx.guild)
-    out = '%s: %s' % (', '.join(m.mention for m in nonmembers), msg)
-    if len(out) < 2000:
+    messages = pack_messages((m.mention for m in nonmembers), msg)
+    if len(messages) > 1:
+      await ctx.send('Pinging %d non-members in %d messages.' % (len(nonmembers), len(messages)))
+    for i, out in enumerate(messages):
+      if i:
+        await asyncio.sleep(self.PING_INTERVAL)
       await self.welcome(ctx, out)
-      return
-
-    await ctx.send('Message len is too big. %d > 2000. Chunking.' % len(out))
-    people = ', '.join(m.mention for m in nonmembers)
-    if len(people) < 2000:
-      await self.welcome(ctx, people)
-      await self.welcome(ctx, msg)
-      return
-
-    people = [', '.join(m.mention for m in subset) for subset in more_itertools.chunked(nonmembers, 50)]
-    if any(len(p) > 2000 for p in people):
-      await ctx.send('People list too big even in chunks. Fail.')
-    for p in people:
-      await self.welcome(ctx, p)
-    await self.welcome(ctx, msg)
 
   @commands.command()
   @commands.check(is_owner)
   async def prune(self, ctx, *args):
     if self.ignore_guild(ctx): return
     role = self.member_role(ctx)
-    inactive_timeout = self.PRUNE_INACTIVE_TIMEOUT * 60 * 60 * 24
+    inactive_timeout = self.inactive_timeout(ctx.guild)
+    kick_days = self._guilds[ctx.guild.id].kick_days
     now = int(time.time())
     dt_now = datetime.datetime.now()
     cutoff = now - inactive_timeout
 
-    active = lambda m: (self.history.get(m.id, 0) > cutoff)
-
-    never_spoke = [m for m in ctx.guild.members if m.id not in self.history]
-    active      = [m for m in ctx.guild.members if active(m)]
-    inactive    = list(set(ctx.guild.members) - set(never_spoke) - set(active))
-
-    inactive_w_role = [m for m in inactive if role in m.roles]
-    never_spoke_wr = [m for m in never_spoke if role in m.roles]
-    drops = inactive_w_role + never_spoke_wr
-
     # People that joined a while ago and never spoke. Stale accounts. Kick?
-    stale_cutoff = dt_now - datetime.timedelta(days=self.PRUNE_KICK_TIMEOUT)
-    stale = [m for m in never_spoke if m.joined_at < stale_cutoff]
-
-    await ctx.send('%d members, %d never spoke, %d inactive, %d active' % (len(ctx.guild.members), len(never_spoke), len(inactive), len(active)))
-    await ctx.send('role_remove: Drop member from %d never spoke and %d inactive' % (len(never_spoke_wr), len(inactive_w_role)))
-    await ctx.send(' '.join(m.display_name for m in drops))
+    stale_cutoff = dt_now - datetime.timedelta(days=kick_days)
+    c = classify.classify(
+        ctx.guild.members,
+        self._guilds[ctx.guild.id].members,
+        self.history.seen(ctx.guild.id),
+        self.history.active_since(ctx.guild.id, cutoff),
+        stale_cutoff)
+
+    await ctx.send('%d members, %d never spoke, %d inactive, %d active' % (len(ctx.guild.members), len(c.never_spoke), len(c.inactive), len(c.active)))
+    await ctx.send('role_remove: Drop member from %d never spoke and %d inactive' % (len(c.never_spoke_wr), len(c.inactive_w_role)))
+    await ctx.send(' '.join(m.display_name for m in c.drops))
     await ctx.send('kick_stale: Kick %d people that are stale (been here %d days and never spoke): %s' % (
-        len(stale), self.PRUNE_KICK_TIMEOUT, ' '.join(m.display_name for m in stale)))
+        len(c.stale), kick_days, ' '.join(m.display_name for m in c.stale)))
 
+    before = self.mutations.stats.copy()
     if 'role_remove' in ctx.message.content.split():
-      for member in drops:
-        await member.remove_roles(role)
+      for member in c.drops:
+        self.mutations.remove_role(member, role)
     if 'kick_stale' in ctx.message.content.split():
-      for member in stale:
-        await member.kick()
+      for member in c.stale:
+        self.mutations.kick(member)
+    await self.wait_for_mutations(ctx, before)
     await ctx.send('Done')
 
+  async def wait_for_mutations(self, ctx, before):
+    """Wait for the mutation queue to drain, reporting progress since `before`."""
+    def status():
+      stats = self.mutations.stats - before
+      total = stats['queued'] - stats['deduped']
+      return 'Applied %d/%d changes, %d failed.' % (
+          stats['done'] + stats['failed'], total, stats['failed'])
+
+    if not (self.mutations.stats - before)['queued']:
+      return
+    progress = await ctx.send(status())
+    drained = asyncio.create_task(self.mutations.join())
+    while not drained.done():
+      await asyncio.wait({drained}, timeout=self.PROGRESS_INTERVAL)
+      await progress.edit(content=status())
+
   @commands.command()
   @commands.check(is_owner)
   async def build_hist(self, ctx, *args):
+    """Build history from channel messages, resuming from per-channel checkpoints."""
     if self.ignore_guild(ctx): return
-    role = self.member_role(message)
-    last_spoke = collections.defaultdict(lambda: datetime.datetime(1990, 1, 1))
-    for channel in ctx.guild.text_channels:
-      if not channel.permissions_for(ctx.guild.me).read_message_history:
-        continue
-      async for message in channel.history(limit=10000, oldest_first=False):
-        if message.is_system() or isinstance(message.author, discord.User):
-          continue
-        last_spoke[message.author] = max(
-            last_spoke[message.author], message.created_at)
-    history = {}
-    for m, dt in last_spoke.items():
-      dt = dt.replace(tzinfo=datetime.timezone(datetime.timedelta()))
-      history[m.id] = int(dt.timestamp())
-    self.history = history
+    role = self.member_role(ctx)
+    channels = [
+        c for c in ctx.guild.text_channels
+        if c.permissions_for(ctx.guild.me).read_message_history]
+    sem = asyncio.Semaphore(self.BUILD_HIST_CONCURRENCY)
+
+    progress = await ctx.send('Scanning %d channels.' % len(channels))
+    done = 0
+    failed = 0
+    next_update = time.time() + self.PROGRESS_INTERVAL
+
+    async def scan(channel):
+      nonlocal done, failed, next_update
+      try:
+        await self.scan_channel(ctx.guild, channel, sem)
+      except discord.HTTPException:
+        logging.exception('build_hist: failed to scan %s', channel.name)
+        failed += 1
+      done += 1
+      if time.time() > next_update:
+        next_update = time.time() + self.PROGRESS_INTERVAL
+        await progress.edit(content='Scanned %d/%d channels (%d failed).' % (
+            done, len(channels), failed))
+
+    await asyncio.gather(*(scan(c) for c in channels))
     self.save_history()
-    await ctx.send('Done. Built history with %d members.' % len(self.history))
+    self.load_expiry(ctx.guild)
+    await progress.edit(content='Scanned %d/%d channels (%d failed).' % (
+        done, len(channels), failed))
+    await ctx.send('Done. Built history with %d members.' % self.history.count(ctx.guild.id))
 
     # Grant the "member" role to any active users.
     if False:
@@ -232,6 +418,69 @@ class Pruner(commands.Cog):
         if role not in member.roles:
           await member.add_roles(role)
 
+  def export_file(self, guild):
+    """Where !export_hist writes and !import_hist reads the guild's history."""
+    return '%s.%d.bin' % (self.history_file(), guild.id)
+
+  @commands.command()
+  @commands.check(is_owner)
+  async def export_hist(self, ctx, *args):
+    """Dump this guild's history to the binary export file."""
+    if self.ignore_guild(ctx): return
+    entries = self.history.items(ctx.guild.id)
+    await asyncio.to_thread(history.write_binary, self.export_file(ctx.guild), entries)
+    await ctx.send('Exported %d members to %s.' % (len(entries), self.export_file(ctx.guild)))
+
+  @commands.command()
+  @commands.check(is_owner)
+  async def import_hist(self, ctx, *args):
+    """Merge the binary export file into this guild's history."""
+    if self.ignore_guild(ctx): return
+    try:
+      entries = await asyncio.to_thread(history.read_binary, self.export_file(ctx.guild))
+    except (OSError, ValueError) as e:
+      await ctx.send('Import failed: %s' % e)
+      return
+    self.history.update(ctx.guild.id, entries)
+    self.save_history()
+    self.load_expiry(ctx.guild)
+    await ctx.send('Imported %d members from %s.' % (len(entries), self.export_file(ctx.guild)))
+
+  async def scan_channel(self, guild, channel, sem):
+    """Merge the message authors of a channel into the history.
+
+    A channel with a checkpoint is read oldest first from the checkpoint,
+    merging and advancing the checkpoint as it goes, so an interrupted scan
+    picks up where it left off. A channel without one is read newest first
+    up to BUILD_HIST_LIMIT messages and checkpointed once complete.
+    """
+    after = self.history.get_checkpoint(channel.id)
+    seen = {}
+    newest = after
+    async with sem:
+      if after:
+        messages = channel.history(
+            limit=None, after=discord.Object(id=after), oldest_first=True)
+      else:
+        messages = channel.history(limit=self.BUILD_HIST_LIMIT, oldest_first=False)
+      count = 0
+      async for message in messages:
+        newest = max(newest or 0, message.id)
+        count += 1
+        if not (message.is_system() or isinstance(message.author, discord.User)):
+          dt = message.created_at.replace(tzinfo=datetime.timezone.utc)
+          seen[message.author.id] = max(int(dt.timestamp()), seen.get(message.author.id, 0))
+        if after and count % self.CHECKPOINT_INTERVAL == 0:
+          self.merge_scan(guild, channel, seen, newest)
+          seen = {}
+    self.merge_scan(guild, channel, seen, newest)
+
+  def merge_scan(self, guild, channel, seen, newest):
+    """Merge scanned {member_id: ts} into the history and checkpoint the channel."""
+    self.history.update(guild.id, seen)
+    self.history.flush()
+    if newest:
+      self.history.set_checkpoint(channel.id, newest)
 
 def main():
   # guild => (welcome channel, member role)
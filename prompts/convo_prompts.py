@@ -1,9 +1,16 @@
 #!/bin/python
 
 import os
-import random
 from discord.ext import commands
 
+try:
+  from ..common import shuffle
+except ImportError:
+  # bot.py runs from the repository root, where the cogs are top-level packages.
+  from common import shuffle
+
+from . import corpus
+
 
 PROMPTS = {
   'creative-writing': 'convo_prompts/prompts_writing.txt',
@@ -11,11 +18,21 @@ PROMPTS = {
 }
 
 
-def PromptGen(lines):
+def PromptGen(prompts):
+  """Yield prompt numbers, from 0, in a fresh random order each pass.
+
+  A pass starts over if the number of prompts changes. Yields None while
+  there are none.
+  """
+  order = shuffle.LazyShuffle()
   while True:
-    random.shuffle(lines)
-    for l in lines:
-      yield l
+    n = len(prompts)
+    if not n:
+      yield None
+      continue
+    order.reset()
+    while order.drawn < n and len(prompts) == n:
+      yield order.draw(n)
 
 
 class Prompts(commands.Cog):
@@ -27,17 +44,10 @@ class Prompts(commands.Cog):
     super()
     if prompts is None:
       prompts = PROMPTS
-    self.prompts = {}
+    # Channels sharing a file share its index but draw in their own order.
+    files = corpus.PromptFiles()
+    self.prompts = {channel: files.Get(filename) for channel, filename in prompts.items()}
     self.generator = {}
-    for channel, filename in prompts.items():
-      with open(filename) as f:
-        lines = f.read().split('\n')
-        lines = [l.strip() for l in lines]
-        lines = [l for l in lines if l and not l.startswith('#')]
-        # Use item position over file line number to avoid gaps.
-        # This does mean it can be offset from file line number.
-        lines = ['%d. %s' % (i+1, j) for i, j in enumerate(lines)]
-        self.prompts[channel] = PromptGen(lines)
 
   @commands.command()
   async def prompt(self, ctx, *args):
@@ -45,7 +55,16 @@ class Prompts(commands.Cog):
     if ctx.channel.name not in self.prompts:
       await ctx.send('No prompts for channel %s' % ctx.channel.name)
       return
-    await ctx.send(next(self.prompts[ctx.channel.name]))
+    prompts = self.prompts[ctx.channel.name]
+    if ctx.channel.name not in self.generator:
+      self.generator[ctx.channel.name] = PromptGen(prompts)
+    i = next(self.generator[ctx.channel.name])
+    if i is None:
+      await ctx.send('No prompts for channel %s' % ctx.channel.name)
+      return
+    # Use item position over file line number to avoid gaps.
+    # This does mean it can be offset from file line number.
+    await ctx.send('%d. %s' % (i + 1, prompts[i]))
 
 
 def main():
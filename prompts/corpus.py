@@ -0,0 +1,160 @@
+#!/bin/python
+
+import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+# Cached line index: a header of magic, version, the prompt file's mtime and
+# size, then little-endian uint64 (start, end) byte offsets of each prompt.
+INDEX_MAGIC = b'PIDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIqQ')
+
+
+class PromptFile:
+  """The prompts in a text file, one per line, read on demand.
+
+  Blank lines and # comments are skipped. The file is memory-mapped and
+  indexed by the byte offsets of each prompt, so only the prompts served
+  are ever decoded. The index is cached next to the file, keyed on its
+  mtime and size, so restarts skip the scan. Nothing is read until the
+  first prompt is asked for, and the file is reopened if it changes.
+  A missing file fails here, at startup, rather than on the first prompt.
+  """
+
+  def __init__(self, filename):
+    if not os.path.isfile(filename):
+      raise FileNotFoundError('No prompt file %s' % filename)
+    self.filename = filename
+    self.index_filename = filename + '.idx'
+    self.mm = None
+    self.offsets = array.array('Q')
+    self.stat = None
+
+  def __len__(self):
+    self._Fresh()
+    return len(self.offsets) // 2
+
+  def __getitem__(self, i):
+    """The text of prompt i, counting from 0."""
+    self._Fresh()
+    if not 0 <= i < len(self.offsets) // 2:
+      raise IndexError(i)
+    start, end = self.offsets[2 * i], self.offsets[2 * i + 1]
+    return self.mm[start:end].decode('utf-8', errors='replace')
+
+  def _Fresh(self):
+    """(Re)open the file if it is new or has changed."""
+    st = os.stat(self.filename)
+    stat = (st.st_mtime_ns, st.st_size)
+    if stat == self.stat:
+      return
+    if self.mm is not None:
+      self.mm.close()
+      self.mm = None
+    self.stat = stat
+    if not st.st_size:
+      self.offsets = array.array('Q')
+      return
+    with open(self.filename, 'rb') as f:
+      self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.offsets = self._LoadIndex()
+    if self.offsets is None:
+      self.offsets = self._BuildIndex()
+      self._SaveIndex()
+
+  def _BuildIndex(self):
+    offsets = array.array('Q')
+    start = 0
+    self.mm.seek(0)
+    for line in iter(self.mm.readline, b''):
+      text = line.strip()
+      if text and not text.startswith(b'#'):
+        lead = len(line) - len(line.lstrip())
+        offsets.append(start + lead)
+        offsets.append(start + lead + len(text))
+      start += len(line)
+    return offsets
+
+  def _LoadIndex(self):
+    try:
+      with open(self.index_filename, 'rb') as f:
+        magic, version, mtime, size = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        if (magic, version, (mtime, size)) != (INDEX_MAGIC, INDEX_VERSION, self.stat):
+          return None
+        offsets = array.array('Q')
+        offsets.frombytes(f.read())
+    except (OSError, struct.error, ValueError):
+      return None
+    if sys.byteorder != 'little':
+      offsets.byteswap()
+    if len(offsets) % 2 or (offsets and offsets[-1] > self.stat[1]):
+      return None
+    return offsets
+
+  def _SaveIndex(self):
+    offsets = self.offsets
+    if sys.byteorder != 'little':
+      offsets = array.array('Q', offsets)
+      offsets.byteswap()
+    tmp = self.index_filename + '.tmp'
+    try:
+      with open(tmp, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, *self.stat))
+        f.write(offsets.tobytes())
+      os.replace(tmp, self.index_filename)
+    except OSError as e:
+      logging.warning('Unable to cache the prompt index for %s: %s', self.filename, e)
+
+
+class PromptFiles:
+  """PromptFiles by path, so a file used by several channels is loaded once."""
+
+  def __init__(self):
+    self.files = {}
+
+  def Get(self, filename) -> PromptFile:
+    path = os.path.realpath(filename)
+    if path not in self.files:
+      self.files[path] = PromptFile(path)
+    return self.files[path]
+
+
+def bench(filename):
+  start = time.perf_counter()
+  with open(filename) as f:
+    lines = [l.strip() for l in f.read().split('\n')]
+    lines = ['%d. %s' % (i + 1, l) for i, l in enumerate(l for l in lines if l and not l.startswith('#'))]
+  eager = time.perf_counter() - start
+
+  prompts = PromptFile(filename)
+  if os.path.exists(prompts.index_filename):
+    os.remove(prompts.index_filename)
+  start = time.perf_counter()
+  count = len(prompts)
+  built = time.perf_counter() - start
+
+  prompts = PromptFile(filename)
+  start = time.perf_counter()
+  len(prompts)
+  cached = time.perf_counter() - start
+
+  assert count == len(lines) and all(
+      '%d. %s' % (i + 1, prompts[i]) == lines[i] for i in range(count))
+  print('%s: %d prompts; eager %.2f ms, index %.2f ms, cached index %.2f ms' % (
+      filename, count, eager * 1000, built * 1000, cached * 1000))
+
+
+def main():
+  for filename in sys.argv[1:]:
+    bench(filename)
+
+
+if __name__ == '__main__':
+  main()
+
+# vim:ts=2:sw=2:expandtab
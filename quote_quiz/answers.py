@@ -0,0 +1,181 @@
+#!/bin/python
+
+import functools
+import os
+import random
+import re
+import string
+import sys
+import time
+
+
+# Words that do not count towards a token set match.
+STOPWORDS = frozenset(['a', 'an', 'the', 'of', 'and'])
+# Leading articles that may be left off a title.
+ARTICLES = ('the ', 'a ', 'an ')
+# Allow one typo per this many characters of the title, up to MAX_TYPOS.
+CHARS_PER_TYPO = 5
+MAX_TYPOS = 3
+
+
+class _Strip(dict):
+  """str.translate table that lowercases and drops anything but letters and digits."""
+
+  def __missing__(self, c):
+    ch = chr(c).lower()
+    self[c] = ch if ch in 'abcdefghijklmnopqrstuvwxyz0123456789' else None
+    return self[c]
+
+
+STRIP = _Strip()
+
+
+def Normalize(s: str) -> str:
+  return s.translate(STRIP)
+
+
+def Tokens(s: str) -> list:
+  """Normalized words of s, with & spelled out."""
+  words = (Normalize(w) for w in s.replace('&', ' and ').split())
+  return [w for w in words if w]
+
+
+def EditDistance(peq, m, text, limit):
+  """Edit distance between a pattern and text, or limit + 1 if it exceeds limit.
+
+  Myers' bit-parallel algorithm; peq maps each character of the pattern to a
+  bitmask of its positions and m is the pattern length. Stops early once the
+  remaining text can no longer bring the distance back under the limit.
+  """
+  if abs(m - len(text)) > limit:
+    return limit + 1
+  if not m:
+    return len(text)
+  full = (1 << m) - 1
+  last = 1 << (m - 1)
+  pv, mv, score = full, 0, m
+  remaining = len(text)
+  for c in text:
+    eq = peq.get(c, 0)
+    xv = eq | mv
+    xh = (((eq & pv) + pv) ^ pv) | eq
+    ph = (mv | ~(xh | pv)) & full
+    mh = pv & xh
+    if ph & last:
+      score += 1
+    elif mh & last:
+      score -= 1
+    ph = ((ph << 1) | 1) & full
+    mh = (mh << 1) & full
+    pv = (mh | ~(xv | ph)) & full
+    mv = ph & xv
+    remaining -= 1
+    if score - remaining > limit:
+      return limit + 1
+  return score
+
+
+class _Key:
+  """A normalized form of a title with its precomputed match mask."""
+
+  def __init__(self, key):
+    self.key = key
+    self.digits = ''.join(c for c in key if c.isdigit())
+    self.limit = min(MAX_TYPOS, len(key) // CHARS_PER_TYPO)
+    self.peq = {}
+    for i, c in enumerate(key):
+      self.peq[c] = self.peq.get(c, 0) | 1 << i
+
+  def Near(self, guess, digits) -> bool:
+    if not self.limit or digits != self.digits:
+      return False
+    return EditDistance(self.peq, len(self.key), guess, self.limit) <= self.limit
+
+
+class Answer:
+  """Checks guesses against a title and its aliases.
+
+  Leaving off a leading article or a subtitle is accepted, as are the same
+  words in another order and a few typos. Numbers must match exactly so
+  sequels are not mistaken for each other.
+  """
+
+  def __init__(self, title: str, aliases=()):
+    self.title = title
+    names = set()
+    for name in (title,) + tuple(aliases):
+      for form in (name, re.split(r'[:(]| - ', name)[0]):
+        form = ' '.join(Tokens(form))
+        if not form:
+          continue
+        names.add(form)
+        for article in ARTICLES:
+          if form.startswith(article) and len(form) > len(article):
+            names.add(form[len(article):])
+    self.exact = {n.replace(' ', '') for n in names}
+    self.token_sets = set()
+    for n in names:
+      words = frozenset(n.split()) - STOPWORDS
+      if words:
+        self.token_sets.add(words)
+    self.keys = [_Key(k) for k in self.exact]
+
+  def Matches(self, guess: str) -> bool:
+    tokens = Tokens(guess)
+    key = ''.join(tokens)
+    if not key:
+      return False
+    if key in self.exact:
+      return True
+    if frozenset(tokens) - STOPWORDS in self.token_sets:
+      return True
+    digits = ''.join(c for c in key if c.isdigit())
+    return any(k.Near(key, digits) for k in self.keys)
+
+
+@functools.lru_cache(maxsize=1024)
+def ForTitle(title: str) -> Answer:
+  """The Answer for a title, shared by every quote from that title."""
+  return Answer(title)
+
+
+def bench(filename):
+  with open(filename) as f:
+    titles = [line.strip() for line in f.readlines()[1::2]]
+  rand = random.Random(0)
+  guesses = []
+  for title in titles:
+    typo = list(title)
+    typo[rand.randrange(len(typo))] = 'x'
+    guesses.append((title, 'The ' + title))
+    guesses.append((title, ''.join(typo)))
+    guesses.append((title, rand.choice(titles)))
+
+  # The old exact match, rebuilding the allowed characters for every character.
+  start = time.perf_counter()
+  strip = lambda s: ''.join(l for l in s.lower() if l in string.ascii_letters + string.digits)
+  exact = sum(strip(g) == strip(t) for t, g in guesses)
+  before = time.perf_counter() - start
+
+  start = time.perf_counter()
+  answers = {t: Answer(t) for t in titles}
+  built = time.perf_counter() - start
+
+  start = time.perf_counter()
+  matched = sum(answers[t].Matches(g) for t, g in guesses)
+  elapsed = time.perf_counter() - start
+
+  print('%d guesses, %d matched exactly, in %.2f ms' % (len(guesses), exact, before * 1000))
+  print('%d titles built in %.2f ms' % (len(titles), built * 1000))
+  print('%d guesses, %d matched, in %.2f ms, %.2f us per guess' % (
+      len(guesses), matched, elapsed * 1000, elapsed / len(guesses) * 1e6))
+
+
+def main():
+  bench(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'quotes.txt'))
+
+
+if __name__ == '__main__':
+  main()
+
+# vim:ts=2:sw=2:expandtab
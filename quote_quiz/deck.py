@@ -0,0 +1,46 @@
+#!/bin/python
+
+import random
+
+try:
+  from ..common import shuffle
+except ImportError:
+  # bot.py runs from the repository root, where the cogs are top-level packages.
+  from common import shuffle
+
+
+class Deck:
+  """Draws quote ids from a Corpus in random order without repeats.
+
+  A lazy shuffle over the ids [0, len(cache)), so a new deck costs nothing
+  and no quotes are copied. Ids of added quotes extend the undrawn range and
+  deleted quotes are skipped when drawn, so corpus edits show up at once.
+  Once every quote has been drawn, the deck starts over. Reloading the
+  corpus renumbers the ids, so that starts the deck over too.
+  """
+
+  def __init__(self, corpus, rand=random):
+    self.corpus = corpus
+    self.order = shuffle.LazyShuffle(rand)
+    self._Reset()
+
+  def _Reset(self):
+    self.generation = self.corpus.generation
+    self.order.reset()
+
+  def Draw(self):
+    """Return the next live Quote."""
+    if self.generation != self.corpus.generation:
+      self._Reset()
+    if not len(self.corpus):
+      raise IndexError('no quotes to draw')
+    cache = self.corpus.cache
+    while True:
+      if self.order.drawn >= len(cache):
+        self._Reset()
+      picked = self.order.draw(len(cache))
+      if cache[picked] is not None:
+        return cache[picked]
+
+
+# vim:ts=2:sw=2:expandtab
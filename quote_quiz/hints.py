@@ -0,0 +1,60 @@
+#!/bin/python
+
+import functools
+import random
+
+from . import answers
+
+
+VOWELS = 'AEIOU'
+
+
+class HintLadder:
+  """Progressively revealing hints for a title, built as they are asked for.
+
+  The first hint gives the word count and first character. After that, every
+  letter and digit is masked and each hint reveals one more of them, vowels
+  first. Each clue is computed from the previous one by revealing the
+  positions of a single letter.
+  """
+
+  def __init__(self, title: str):
+    self.title = title
+    upper = title.upper()
+    # letter => positions it occupies in the title, after the first character.
+    self.positions = {}
+    for i, c in enumerate(upper[1:], 1):
+      if c.translate(answers.STRIP):
+        self.positions.setdefault(c, []).append(i)
+    letters = list(self.positions)
+    random.shuffle(letters)
+    self.order = [l for l in letters if l in VOWELS] + [l for l in letters if l not in VOWELS]
+    self.mask = list(upper)
+    for positions in self.positions.values():
+      for i in positions:
+        self.mask[i] = '_'
+    self.mask[:1] = title[:1]
+    self.hints = ['%d words, starts with %s' % (len(title.split()), title[:1])]
+
+  def __len__(self):
+    # Revealing the last letter would give away the title.
+    return max(1, len(self.order))
+
+  def __getitem__(self, n):
+    if not 0 <= n < len(self):
+      raise IndexError(n)
+    while len(self.hints) <= n:
+      letter = self.order[len(self.hints) - 1]
+      for i in self.positions[letter]:
+        self.mask[i] = letter
+      self.hints.append('`%s`' % ' '.join(self.mask))
+    return self.hints[n]
+
+
+@functools.lru_cache(maxsize=256)
+def ForTitle(title: str) -> HintLadder:
+  """The HintLadder for a title, reused across rounds."""
+  return HintLadder(title)
+
+
+# vim:ts=2:sw=2:expandtab
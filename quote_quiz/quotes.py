@@ -1,30 +1,67 @@
 #!/bin/python
 
+import asyncio
 import collections
-import more_itertools
+import discord
+import json
+import logging
 import os
-import random
-import re
-import string
 import sys
+import time
+import tracemalloc
 from dataclasses import dataclass
 from discord.ext import commands
+from discord.ext import tasks
 
+try:
+  from ..common import heap
+  from ..common import journal
+except ImportError:
+  # bot.py runs from the repository root, where the cogs are top-level packages.
+  from common import heap
+  from common import journal
 
-QUOTES = 'quotes.txt'
+from . import answers
+from . import deck
+from . import hints
+from . import scores
 
-def SuperStrip(s):
-  return ''.join(l for l in s.lower() if l in string.ascii_letters + string.digits)
 
+QUOTES = 'quotes.txt'
+# Scores database, kept beside the quotes file unless QUOTEQUIZ_SCOREFILE is set.
+SCORES = 'scores.db'
+# Name of the corpus when given a single file.
+DEFAULT_CORPUS = 'movies'
+# How often to check the quotes file for outside edits.
+WATCH_INTERVAL_SECONDS = 10
+# How often to check for idle rounds and stale state.
+EXPIRE_INTERVAL_SECONDS = 5
+# How often to write changed scores.
+FLUSH_INTERVAL_SECONDS = 60
 
-@dataclass
 class Quote:
-  quote: str
-  movie: str
+  """A quote and the movie it is from.
 
-  def __post_init__(self):
-    self.quote = self.quote.strip()
-    self.movie = self.movie.strip()
+  Slotted, with interned titles, to keep large corpora small. Callers pass
+  clean text; the loaders strip what they read.
+  """
+  __slots__ = ('quote', 'movie', 'id')
+
+  def __init__(self, quote: str, movie: str, id: int = None):
+    self.quote = quote
+    self.movie = sys.intern(movie)
+    # Slot in Corpus.cache; stable until the corpus is reloaded.
+    self.id = id
+
+  def __eq__(self, other):
+    if not isinstance(other, Quote):
+      return NotImplemented
+    return (self.quote, self.movie) == (other.quote, other.movie)
+
+  __hash__ = None
+
+  def __repr__(self):
+    return 'Quote(quote=%r, movie=%r)' % (self.quote, self.movie)
 
   def __str__(self):
     return '%s\n%s\n' % (self.quote, self.movie)
@@ -33,35 +70,19 @@ class Quote:
 @dataclass
 class ActiveQuote:
   quote: Quote
+  # Name of the corpus the quote was drawn from.
+  corpus: str = DEFAULT_CORPUS
+  # Where the round is played.
+  channel: object = None
   guesses: int = 0
   hint_count: int = 0
 
   def GuessMatches(self, title) -> bool:
     self.guesses += 1
-    return SuperStrip(title) == SuperStrip(self.quote.movie)
+    return answers.ForTitle(self.quote.movie).Matches(title)
 
   def __post_init__(self):
-    title = self.quote.movie
-    first = title[0]
-    self.hints = [
-      '%d words, starts with %s' % (len(title.split()), first)
-    ]
-
-    letters = list(l.upper() for l in set(SuperStrip(title[1:])))
-    random.shuffle(letters)
-    vowels = [l for l in letters if l in 'AEIOU']
-    consts = [l for l in letters if l not in 'AEIOU']
-    letters = vowels + consts
-    h = []
-    clue = title.upper()
-    while letters:
-      l = letters.pop()
-      clue = re.sub(l, '_', clue)
-      clue = first + clue[1:]
-      h.append('`%s`' % ' '.join(a for a in clue))
-    h.pop()
-    h.reverse()
-    self.hints.extend(h)
+    self.hints = hints.ForTitle(self.quote.movie)
 
   def Answer(self) -> str:
     return '%s --%s' % (self.quote.quote, self.quote.movie)
@@ -76,38 +97,258 @@ class ActiveQuote:
     return '(%d guesses, %d hints) The movie is: %s' % (
         self.guesses, self.hint_count, self.quote.movie)
 
-class Quotes:
+class Corpus:
+  """A quote corpus, persisted as a snapshot plus an append-only journal.
+
+  The snapshot is the two lines per quote file. Adds and deletes are
+  appended to the journal as JSON lines so an edit only costs one line.
+  Once the journal holds COMPACT_AFTER edits it is folded back into the
+  snapshot, which is written to a temp file and renamed into place.
+
+  Quotes live in `cache` at the slot given by their id. A deleted quote
+  leaves an empty slot so ids stay stable until the next reload, which
+  bumps `generation`.
+  """
+
+  # Journal entries to collect before compacting.
+  COMPACT_AFTER = 50
 
   def __init__(self, filename: str):
     self._filename = filename
-    self.quotes = []
+    self._journal = journal.Journal(filename)
+    self._journaled = 0
+    self._compacting = None
+    self._reloading = False
+    self._signature = None
+    self.generation = 0
+    # deck key => Deck
+    self.decks = {}
     self.LoadQuotes()
 
+  def __len__(self):
+    return self._live
+
   def LoadQuotes(self):
-    self.cache = []
+    """Load the snapshot then replay the journals over it."""
+    self._Install(self._Read())
+
+  async def ReloadAsync(self):
+    """Reload the corpus, reading it in a worker thread.
+
+    The old corpus keeps serving until the new one is read in full, then
+    they are swapped at once. Edits made meanwhile are replayed on top.
+    """
+    if self._reloading:
+      return
+    self._reloading = True
+    try:
+      if self._compacting is not None:
+        await self._compacting
+      self._Install(await asyncio.to_thread(self._Read))
+    finally:
+      self._reloading = False
+
+  def _Read(self):
+    """Read the snapshot and journals. Touches no state, so it can run in a thread.
+
+    Returns the quotes by id, the live ids by content for replaying deletes,
+    the number of journal entries and how far into the journal was read.
+    """
+    signature = self._Signature()
+    # Replaying edits quotes.txt already has would add those quotes twice.
+    self._journal.drop_stale()
+    cache = []
+    by_content = collections.defaultdict(list)
+    for q in self._ReadSnapshot():
+      q.id = len(cache)
+      cache.append(q)
+      by_content[q.quote, q.movie].append(q.id)
+    journaled = 0
+    offset = 0
+    for filename in (self._journal.old_log_filename, self._journal.log_filename):
+      for op, q, end in self._ReadJournal(filename):
+        journaled += 1
+        if filename == self._journal.log_filename:
+          offset = end
+        if op == 'add':
+          q.id = len(cache)
+          cache.append(q)
+          by_content[q.quote, q.movie].append(q.id)
+        elif by_content[q.quote, q.movie]:
+          cache[by_content[q.quote, q.movie].pop()] = None
+    return cache, by_content, journaled, offset, signature
+
+  def _Install(self, loaded):
+    cache, by_content, self._journaled, offset, self._signature = loaded
+    self.cache = cache
+    self._live = sum(q is not None for q in cache)
+    self.generation += 1
+    # Edits journaled after the read got that far.
+    for op, q, _ in self._ReadJournal(self._journal.log_filename, offset):
+      self._journaled += 1
+      if op == 'add':
+        self._Add(q)
+      elif by_content[q.quote, q.movie]:
+        self._Remove(by_content[q.quote, q.movie].pop())
+
+  def _Signature(self):
+    """Modification time and size of the corpus files, to notice outside edits."""
+    sig = []
+    for filename in (self._filename, self._journal.log_filename):
+      try:
+        st = os.stat(filename)
+        sig.append((st.st_mtime_ns, st.st_size))
+      except FileNotFoundError:
+        sig.append(None)
+    return tuple(sig)
+
+  def Changed(self) -> bool:
+    """Whether the corpus files were changed by something other than this process."""
+    if self._reloading or self._compacting is not None:
+      return False
+    return self._Signature() != self._signature
+
+  def _ReadSnapshot(self):
+    if not os.path.exists(self._filename):
+      return
     with open(self._filename) as f:
-      for i, lines in enumerate(more_itertools.chunked(f.readlines(), 2)):
-        self.cache.append(Quote(quote=lines[0], movie=lines[1]))
-        
-  def GetQuote(self) -> ActiveQuote:
-    if not self.quotes:
-      self.quotes = list(self.cache)
-      random.shuffle(self.quotes)
-    return ActiveQuote(quote=self.quotes.pop())
+      for n, quote in enumerate(f):
+        movie = next(f, None)
+        if movie is None:
+          logging.warning('Skipping quote without a movie at %s:%d: %r', self._filename, 2 * n + 1, quote)
+          return
+        q = Quote(quote=quote.strip(), movie=movie.strip())
+        if not q.quote or not q.movie:
+          logging.warning('Skipping blank quote entry at %s:%d', self._filename, 2 * n + 1)
+          continue
+        yield q
+
+  def _ReadJournal(self, filename, offset=0):
+    """Yield (op, quote, offset after the entry) for journal entries past offset."""
+    for line, end in self._journal.read(filename, offset):
+      try:
+        entry = json.loads(line)
+        op = entry['op']
+        q = Quote(quote=entry['quote'], movie=entry['movie'])
+      except (ValueError, KeyError, TypeError, AttributeError):
+        logging.warning('Skipping malformed quote journal line in %s: %r', filename, line)
+        continue
+      if op in ('add', 'del'):
+        yield op, q, end
+
+  def _Add(self, q):
+    q.id = len(self.cache)
+    self.cache.append(q)
+    self._live += 1
+
+  def _Remove(self, quote_id):
+    self.cache[quote_id] = None
+    self._live -= 1
+
+  def Draw(self, key=None) -> Quote:
+    """Draw a quote from the deck for key; callers sharing a key get no repeats."""
+    if key not in self.decks:
+      self.decks[key] = deck.Deck(self)
+    return self.decks[key].Draw()
 
   def AddQuote(self, quote, movie):
-    self.cache.append(Quote(quote=quote, movie=movie))
-    self.Persist()
-    
-  def DelQuote(self, quote):
-    self.cache.remove(quote)
-    self.Persist()
+    q = Quote(quote=' '.join(quote.split()), movie=' '.join(movie.split()))
+    self._Add(q)
+    self._Log('add', q)
+
+  def DelQuote(self, quote) -> bool:
+    """Delete a quote. Returns False if it was already deleted."""
+    if quote.id is None or quote.id >= len(self.cache) or self.cache[quote.id] is not quote:
+      # Quotes served before a reload are stale copies; find the reloaded one.
+      quote = next((q for q in self.cache if q == quote), None)
+      if quote is None:
+        return False
+    self._Remove(quote.id)
+    self._Log('del', quote)
+    return True
+
+  def _Log(self, op, q):
+    self._journal.append(json.dumps({'op': op, 'quote': q.quote, 'movie': q.movie}) + '\n')
+    self._signature = self._Signature()
+    self._journaled += 1
+    if self._journaled >= self.COMPACT_AFTER:
+      self._MaybeCompact()
+
+  def _MaybeCompact(self):
+    if self._compacting is not None or self._reloading:
+      return
+    try:
+      asyncio.get_running_loop()
+    except RuntimeError:
+      self.Persist()
+      return
+    self._compacting = asyncio.create_task(self.PersistAsync())
+
+  def _Rotate(self):
+    """Set the logged edits aside and start a new log. Returns the quotes to write."""
+    self._journal.rotate()
+    self._journaled = 0
+    return [q for q in self.cache if q is not None]
+
+  def _WriteSnapshot(self, quotes):
+    self._journal.write_snapshot(lambda f: f.writelines(str(q) for q in quotes))
+    self._signature = self._Signature()
 
   def Persist(self):
-    with open(self._filename, 'wt') as f:
-      for q in self.cache:
-        f.write(str(q))
-    
+    """Rewrite quotes.txt with every live quote and drop the edit log."""
+    self._WriteSnapshot(self._Rotate())
+
+  async def PersistAsync(self):
+    """Persist, writing the quote and movie lines from a worker thread.
+
+    Quotes added or deleted meanwhile are logged to the new .log file.
+    """
+    try:
+      await asyncio.to_thread(self._WriteSnapshot, self._Rotate())
+    finally:
+      self._compacting = None
+
+
+class Quotes:
+  """Named quote corpora, eg movies, TV and books."""
+
+  def __init__(self, corpora):
+    """corpora is a filename, or a dict of corpus name => filename."""
+    if isinstance(corpora, str):
+      corpora = {DEFAULT_CORPUS: corpora}
+    self.corpora = {name: Corpus(filename) for name, filename in corpora.items()}
+    self.default = next(iter(self.corpora))
+
+  def __contains__(self, name):
+    return name in self.corpora
+
+  def __getitem__(self, name) -> Corpus:
+    return self.corpora[name]
+
+  def Names(self):
+    return list(self.corpora)
+
+  def DropDecks(self, key):
+    """Forget the decks for key in every corpus."""
+    for corpus in self.corpora.values():
+      corpus.decks.pop(key, None)
+
+  def GetQuote(self, name, key=None) -> ActiveQuote:
+    return ActiveQuote(quote=self.corpora[name].Draw(key), corpus=name)
+
+  def AddQuote(self, name, quote, movie):
+    self.corpora[name].AddQuote(quote, movie)
+
+  def DelQuote(self, active) -> bool:
+    return self.corpora[active.corpus].DelQuote(active.quote)
+
+  def Changed(self):
+    """Names of the corpora whose files were edited by something else."""
+    return [name for name, corpus in self.corpora.items() if corpus.Changed()]
+
+  async def ReloadAsync(self, names=None):
+    await asyncio.gather(*(self.corpora[n].ReloadAsync() for n in names or self.corpora))
+
 
 class QuoteQuiz(commands.Cog):
   """Try to guess where a quote is from."""
@@ -115,15 +356,111 @@ class QuoteQuiz(commands.Cog):
   qualified_name = 'Quote Quiz'
   PROMPT = 'Try to `!guess` the movie for this quote: %s'
   ATTEMPTS = 4
-
-  def __init__(self, filename=QUOTES):
+  # Which channels share a deck of quotes and so never repeat each other's.
+  DECKS = ('channel', 'guild', 'global')
+  # Seconds without a guess or hint before a round's answer is revealed.
+  ROUND_TIMEOUT = 300
+  # Seconds to keep a half entered !addquote/!addmovie.
+  ADDING_TTL = 600
+  # Seconds after its last round before a channel's deck is dropped.
+  DECK_TTL = 24 * 60 * 60
+  # Points for a correct guess, less the cost of each hint and each wrong guess.
+  POINTS = 10
+  HINT_COST = 2
+  GUESS_COST = 1
+  MIN_POINTS = 1
+  # Most entries shown by !leaderboard.
+  LEADERBOARD_MAX = 25
+
+  def __init__(self, corpora=QUOTES):
     super()
-    self.quotes = Quotes(filename)
-    self.adding = collections.defaultdict(dict)
-    self.current = collections.defaultdict(lambda: None)
+    self.quotes = Quotes(corpora)
+    # channel id => name of the corpus it plays, if not the default.
+    self.channel_corpus = {}
+    self.deck = os.getenv('QUOTEQUIZ_DECK', 'channel')
+    if self.deck not in self.DECKS:
+      raise ValueError('QUOTEQUIZ_DECK must be one of %s' % ', '.join(self.DECKS))
+    self.round_timeout = int(os.getenv('QUOTEQUIZ_ROUND_TIMEOUT', self.ROUND_TIMEOUT))
+    # author id => pending quote and/or movie
+    self.adding = {}
+    # channel id => ActiveQuote
+    self.current = {}
+    # ('round', channel id), ('adding', author id) or ('deck', channel id) => when to expire it.
+    self.timeouts = heap.LazyHeap()
+    quotes_file = corpora if isinstance(corpora, str) else next(iter(corpora.values()))
+    self.scores = scores.Scores(os.getenv(
+        'QUOTEQUIZ_SCOREFILE', os.path.join(os.path.dirname(quotes_file), SCORES)))
+    self.watch_quotes.start()
+    self.expire_state.start()
+    self.flush_scores.start()
+
+  def cog_unload(self):
+    self.watch_quotes.cancel()
+    self.expire_state.cancel()
+    self.flush_scores.cancel()
+    self.scores.Close()
+
+  @tasks.loop(seconds=FLUSH_INTERVAL_SECONDS)
+  async def flush_scores(self):
+    """Write the scores changed since the last flush in one batch."""
+    self.scores.Flush()
+
+  @tasks.loop(seconds=EXPIRE_INTERVAL_SECONDS)
+  async def expire_state(self):
+    """Reveal idle rounds and drop state nobody is using."""
+    now = time.monotonic()
+    for kind, key in self.timeouts.pop_until(now):
+      if kind == 'adding':
+        self.adding.pop(key, None)
+      elif kind == 'deck':
+        self.quotes.DropDecks(key)
+      elif kind == 'round':
+        active = self.current.pop(key, None)
+        if active is None:
+          continue
+        if self.deck == 'channel':
+          self.timeouts.set(('deck', key), now + self.DECK_TTL)
+        try:
+          await active.channel.send('Time is up! %s' % active.Answer())
+        except discord.HTTPException:
+          logging.exception('Failed to reveal the answer in %s', active.channel)
+
+  @tasks.loop(seconds=WATCH_INTERVAL_SECONDS)
+  async def watch_quotes(self):
+    """Reload the quotes when the file is edited by hand."""
+    changed = self.quotes.Changed()
+    if changed:
+      logging.info('Quotes changed in %s; reloading', ', '.join(changed))
+      await self.quotes.ReloadAsync(changed)
+
+  def DeckKey(self, ctx):
+    if self.deck == 'global':
+      return None
+    if self.deck == 'guild' and ctx.guild is not None:
+      return ctx.guild.id
+    return ctx.channel.id
+
+  def ScoreKey(self, ctx):
+    return ctx.guild.id if ctx.guild is not None else ctx.channel.id
+
+  def Points(self, active) -> int:
+    wrong = active.guesses - 1
+    points = self.POINTS - self.HINT_COST * active.hint_count - self.GUESS_COST * wrong
+    return max(self.MIN_POINTS, points)
+
+  def CorpusName(self, ctx) -> str:
+    return self.channel_corpus.get(ctx.channel.id, self.quotes.default)
+
+  def Touch(self, ctx):
+    """Push back the idle timeout of the round in this channel."""
+    self.timeouts.set(('round', ctx.channel.id), time.monotonic() + self.round_timeout)
+    self.timeouts.discard(('deck', ctx.channel.id))
 
   async def NextQuote(self, ctx):
-    self.current[ctx.channel] = self.quotes.GetQuote()
+    active = self.quotes.GetQuote(self.CorpusName(ctx), self.DeckKey(ctx))
+    active.channel = ctx.channel
+    self.current[ctx.channel.id] = active
+    self.Touch(ctx)
     await ctx.send(self.PROMPT % self.CurQ(ctx).quote.quote)
 
   def FullQuote(self, ctx) -> str:
@@ -132,11 +469,14 @@ class QuoteQuiz(commands.Cog):
   def CommandContent(self, ctx):
     return ctx.message.content[len(ctx.invoked_with) + 2:]
 
-  async def MaybeAddNew(self, ctx):
-    entry = self.adding[ctx.author]
+  async def MaybeAddNew(self, ctx, field, value):
+    entry = self.adding.setdefault(ctx.author.id, {})
+    entry[field] = value
+    self.timeouts.set(('adding', ctx.author.id), time.monotonic() + self.ADDING_TTL)
     if 'quote' in entry and 'movie' in entry:
-      self.quotes.AddQuote(entry['quote'], entry['movie'])
-      del self.adding[ctx.author]
+      self.quotes.AddQuote(self.CorpusName(ctx), entry['quote'], entry['movie'])
+      del self.adding[ctx.author.id]
+      self.timeouts.discard(('adding', ctx.author.id))
       await ctx.send('%s added a new quote!' % ctx.author.display_name)
     elif 'quote' in entry and 'movie' not in entry:
       await ctx.send('Now tell me what movie that was from, %s, with `!addmovie The Movie Title`' % ctx.author.display_name)
@@ -148,7 +488,7 @@ class QuoteQuiz(commands.Cog):
     return interactions >= self.ATTEMPTS
 
   def CurQ(self, ctx) -> ActiveQuote:
-    return self.current[ctx.channel]
+    return self.current.get(ctx.channel.id)
 
   def IsActive(self, ctx) -> bool:
     return self.CurQ(ctx) is not None
@@ -168,46 +508,110 @@ class QuoteQuiz(commands.Cog):
   async def guess(self, ctx):
     if not self.IsActive(ctx):
       return
+    self.Touch(ctx)
     if self.CurQ(ctx).GuessMatches(self.CommandContent(ctx)):
-      await ctx.send('%s got it! %s' % (
-          ctx.author.display_name, self.CurQ(ctx).Result()))
+      points = self.Points(self.CurQ(ctx))
+      total = self.scores.Award(self.ScoreKey(ctx), ctx.author.id, points)
+      await ctx.send('%s got it for %d points (%d total)! %s' % (
+          ctx.author.display_name, points, total, self.CurQ(ctx).Result()))
       await self.NextQuote(ctx)
     else:
       await ctx.send('%s, that is not it.' % ctx.author.display_name)
 
+  @commands.command()
+  async def leaderboard(self, ctx, n: int = 10):
+    """Show the top scores in this server."""
+    n = max(1, min(n, self.LEADERBOARD_MAX))
+    top = self.scores.Top(self.ScoreKey(ctx), n)
+    if not top:
+      await ctx.send('Nobody has scored yet. Start with `!quote`.')
+      return
+    lines = []
+    for i, (member_id, points) in enumerate(top, 1):
+      member = ctx.guild.get_member(member_id) if ctx.guild is not None else None
+      name = member.display_name if member is not None else 'Someone'
+      lines.append('%d. %s: %d' % (i, name, points))
+    if ctx.author.id not in (m for m, _ in top):
+      lines.append('You: %d' % self.scores.Get(self.ScoreKey(ctx), ctx.author.id))
+    await ctx.send('\n'.join(lines))
+
   @commands.command()
   async def reload_cache(self, ctx):
-    self.quotes.LoadQuotes()
+    await self.quotes.ReloadAsync()
     await ctx.send('ok')
 
+  @commands.command()
+  async def corpus(self, ctx, name=None):
+    """Pick the quotes to play in this channel, or list them."""
+    if name is None:
+      await ctx.send('Playing %s. Quotes: %s' % (
+          self.CorpusName(ctx), ', '.join(self.quotes.Names())))
+      return
+    if name not in self.quotes:
+      await ctx.send('No quotes named %s. Try one of: %s' % (name, ', '.join(self.quotes.Names())))
+      return
+    self.channel_corpus[ctx.channel.id] = name
+    await ctx.send('Now playing %s.' % name)
+    await self.NextQuote(ctx)
+
   @commands.command()
   async def hint(self, ctx):
     if not self.IsActive(ctx):
       return
+    self.Touch(ctx)
     await ctx.send(self.CurQ(ctx).Hint())
 
   @commands.command()
   async def delquote(self, ctx):
     if not self.IsActive(ctx):
       return
-    self.quotes.DelQuote(self.CurQ(ctx).quote)
-    await ctx.send('Deleted the last quote (%s)' % self.FullQuote(ctx))
+    if self.quotes.DelQuote(self.CurQ(ctx)):
+      await ctx.send('Deleted the last quote (%s)' % self.FullQuote(ctx))
+    else:
+      await ctx.send('That quote is already gone (%s)' % self.FullQuote(ctx))
     await self.NextQuote(ctx)
 
   @commands.command()
   async def addquote(self, ctx):
-    self.adding[ctx.author]['quote'] = self.CommandContent(ctx)
-    await self.MaybeAddNew(ctx)
+    await self.MaybeAddNew(ctx, 'quote', self.CommandContent(ctx))
 
   @commands.command()
   async def addmovie(self, ctx):
-    self.adding[ctx.author]['movie'] = self.CommandContent(ctx)
-    await self.MaybeAddNew(ctx)
+    await self.MaybeAddNew(ctx, 'movie', self.CommandContent(ctx))
+
+
+def memory(filename=os.path.join(os.path.dirname(__file__), QUOTES), n=100000):
+  """Compare the memory used per quote against a plain dataclass."""
+  @dataclass
+  class DictQuote:
+    quote: str
+    movie: str
+    id: int = None
+
+  with open(filename) as f:
+    lines = [line.strip() for line in f]
+  entries = list(zip(lines[::2], lines[1::2]))
+  texts = ['%s #%d' % (entries[i % len(entries)][0], i) for i in range(n)]
+  for cls in (DictQuote, Quote):
+    tracemalloc.start()
+    # Titles are read fresh for every quote, as from a file.
+    corpus = [cls(quote=t, movie=(entries[i % len(entries)][1] + ' ')[:-1], id=i)
+              for i, t in enumerate(texts)]
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('%-9s %d quotes: %6.2f MB, %5.1f bytes per quote, excluding quote text' % (
+        cls.__name__, n, used / 1e6, used / n))
+    del corpus
 
 
 def main():
+  if 'memory' in sys.argv:
+    args = sys.argv[sys.argv.index('memory') + 1:]
+    memory(*args[:1])
+    return
+
   if 'hints' in sys.argv:
-    q = Quote(quote='', movie='Mommie Dearest')
+    q = Quote(quote='', movie=sys.argv[2] if len(sys.argv) > 2 else 'Mommie Dearest')
     a = ActiveQuote(quote=q)
     print('\n'.join(a.hints))
     return
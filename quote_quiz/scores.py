@@ -0,0 +1,173 @@
+#!/bin/python
+
+import random
+import sqlite3
+import sys
+import time
+
+
+class Ranking:
+  """Members ordered by points, highest first, kept in a skip list.
+
+    Set: O(log n) expected
+    Top(n): O(n)
+  """
+
+  MAX_LEVEL = 24
+  # Chance of a node reaching each next level.
+  P = 0.25
+
+  def __init__(self, rand=random):
+    self.rand = rand
+    # A node is [key, forward pointers]; keys sort highest points first.
+    self.head = [None, [None] * self.MAX_LEVEL]
+    self.level = 1
+    # member => points
+    self.points = {}
+
+  def __len__(self):
+    return len(self.points)
+
+  def _Path(self, key):
+    """The last node before key at each level."""
+    path = [self.head] * self.MAX_LEVEL
+    node = self.head
+    for i in range(self.level - 1, -1, -1):
+      while node[1][i] is not None and node[1][i][0] < key:
+        node = node[1][i]
+      path[i] = node
+    return path
+
+  def _Insert(self, key):
+    path = self._Path(key)
+    level = 1
+    while level < self.MAX_LEVEL and self.rand.random() < self.P:
+      level += 1
+    self.level = max(self.level, level)
+    node = [key, [None] * level]
+    for i in range(level):
+      node[1][i] = path[i][1][i]
+      path[i][1][i] = node
+
+  def _Remove(self, key):
+    path = self._Path(key)
+    node = path[0][1][0]
+    for i in range(len(node[1])):
+      path[i][1][i] = node[1][i]
+    while self.level > 1 and self.head[1][self.level - 1] is None:
+      self.level -= 1
+
+  def Set(self, member, points):
+    if member in self.points:
+      self._Remove((-self.points[member], member))
+    self.points[member] = points
+    self._Insert((-points, member))
+
+  def Get(self, member, default=0):
+    return self.points.get(member, default)
+
+  def Top(self, n):
+    """The n members with the most points, as (member, points)."""
+    out = []
+    node = self.head[1][0]
+    while node is not None and len(out) < n:
+      out.append((node[0][1], -node[0][0]))
+      node = node[1][0]
+    return out
+
+
+class Scores:
+  """QuoteQuiz points per guild member, stored in SQLite.
+
+  All scores are held in memory, ranked per guild, so leaderboards never
+  touch the database. Awards only mark members dirty; Flush() writes the
+  latest totals of everyone changed since the last flush in one
+  transaction, however many points they won in between.
+  """
+
+  SCHEMA = """
+    CREATE TABLE IF NOT EXISTS scores (
+      guild_id INTEGER NOT NULL,
+      member_id INTEGER NOT NULL,
+      points INTEGER NOT NULL,
+      PRIMARY KEY (guild_id, member_id)
+    ) WITHOUT ROWID;
+  """
+
+  def __init__(self, filename):
+    self.db = sqlite3.connect(filename)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('PRAGMA synchronous=NORMAL')
+    self.db.executescript(self.SCHEMA)
+    # guild id => Ranking
+    self.rankings = {}
+    # (guild id, member id) pending a write.
+    self.dirty = set()
+    for guild_id, member_id, points in self.db.execute('SELECT * FROM scores'):
+      self.GuildRanking(guild_id).Set(member_id, points)
+
+  def GuildRanking(self, guild_id) -> Ranking:
+    if guild_id not in self.rankings:
+      self.rankings[guild_id] = Ranking()
+    return self.rankings[guild_id]
+
+  def Award(self, guild_id, member_id, points) -> int:
+    """Add points to a member. Returns their new total."""
+    ranking = self.GuildRanking(guild_id)
+    total = ranking.Get(member_id) + points
+    ranking.Set(member_id, total)
+    self.dirty.add((guild_id, member_id))
+    return total
+
+  def Top(self, guild_id, n):
+    if guild_id not in self.rankings:
+      return []
+    return self.rankings[guild_id].Top(n)
+
+  def Get(self, guild_id, member_id):
+    if guild_id not in self.rankings:
+      return 0
+    return self.rankings[guild_id].Get(member_id)
+
+  def Flush(self):
+    """Write the totals of everyone awarded points since the last flush."""
+    if not self.dirty:
+      return
+    rows = [(g, m, self.rankings[g].Get(m)) for g, m in self.dirty]
+    self.dirty = set()
+    with self.db:
+      self.db.executemany(
+          'INSERT OR REPLACE INTO scores (guild_id, member_id, points) VALUES (?, ?, ?)', rows)
+
+  def Close(self):
+    self.Flush()
+    self.db.close()
+
+
+def bench(n, updates=100000):
+  """Time point awards spread over n members, then a top 10."""
+  rand = random.Random(0)
+  scores = Scores(':memory:')
+  start = time.perf_counter()
+  for _ in range(updates):
+    scores.Award(1, rand.randrange(n), rand.randint(1, 10))
+  awarded = time.perf_counter() - start
+  start = time.perf_counter()
+  scores.Top(1, 10)
+  top = time.perf_counter() - start
+  start = time.perf_counter()
+  scores.Flush()
+  flushed = time.perf_counter() - start
+  print('%6d members: %.2f us per award, top 10 in %.1f us, flush in %.2f ms' % (
+      n, awarded / updates * 1e6, top * 1e6, flushed * 1000))
+
+
+def main():
+  for n in (100, 10000, 100000):
+    bench(n)
+
+
+if __name__ == '__main__':
+  main()
+
+# vim:ts=2:sw=2:expandtab
@@ -0,0 +1,55 @@
+#!/bin/python
+
+import random
+
+import pytest
+
+from quote_quiz import answers
+
+
+def distance(a, b):
+  """Plain dynamic programming edit distance."""
+  row = list(range(len(b) + 1))
+  for i, x in enumerate(a, 1):
+    prev, row[0] = row[0], i
+    for j, y in enumerate(b, 1):
+      prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (x != y))
+  return row[-1]
+
+
+def test_edit_distance_matches_dynamic_programming():
+  rand = random.Random(0)
+  for _ in range(5000):
+    a = ''.join(rand.choice('abc') for _ in range(rand.randint(0, 70)))
+    b = ''.join(rand.choice('abc') for _ in range(rand.randint(0, 70)))
+    limit = rand.randint(0, 5)
+    key = answers._Key(a)
+    want = distance(a, b)
+    assert answers.EditDistance(key.peq, len(a), b, limit) == min(want, limit + 1), (a, b, limit)
+
+
+@pytest.mark.parametrize('guess', [
+    'Lord of the Rings',
+    'the lord of the rings',
+    'Lord of teh Rings',
+    'lord of the rings fellowship ring',
+])
+def test_answer_accepts(guess):
+  assert answers.Answer('The Lord of the Rings: The Fellowship of the Ring').Matches(guess)
+
+
+@pytest.mark.parametrize('title, guess', [
+    ('The Lord of the Rings: The Fellowship of the Ring', 'LOTR: the fellowship of the ring'),
+    ('Terminator 2', 'The Terminator'),
+    ('Up', 'Us'),
+    ('Up', ''),
+])
+def test_answer_rejects(title, guess):
+  assert not answers.Answer(title).Matches(guess)
+
+
+def test_answer_spells_out_ampersand():
+  assert answers.Answer('Dumb & Dumber').Matches('dumb and dumber')
+
+
+# vim:ts=2:sw=2:expandtab
@@ -0,0 +1,39 @@
+#!/bin/python
+
+import random
+
+import pytest
+
+from quote_quiz import scores
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_ranking_matches_sorting(seed):
+  rand = random.Random(seed)
+  ranking = scores.Ranking(rand)
+  model = {}
+  for _ in range(5000):
+    member = rand.randrange(200)
+    model[member] = model.get(member, 0) + rand.randint(1, 10)
+    ranking.Set(member, model[member])
+    want = sorted(model.items(), key=lambda i: (-i[1], i[0]))[:10]
+    assert ranking.Top(10) == want
+  assert len(ranking) == len(model)
+
+
+def test_scores_persist_flushed_awards(tmp_path):
+  filename = str(tmp_path / 'scores.db')
+  s = scores.Scores(filename)
+  s.Award(1, 10, 5)
+  s.Award(1, 10, 3)
+  s.Award(1, 11, 4)
+  s.Award(2, 10, 1)
+  s.Close()
+  s = scores.Scores(filename)
+  assert s.Top(1, 10) == [(10, 8), (11, 4)]
+  assert s.Get(2, 10) == 1
+  assert s.Top(3, 10) == []
+  s.Close()
+
+
+# vim:ts=2:sw=2:expandtab
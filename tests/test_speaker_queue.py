@@ -0,0 +1,90 @@
+#!/bin/python
+
+import random
+
+import pytest
+
+from discussion_queue import speaker_queue
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_speaker_queue_matches_list(seed):
+  """Random operations on a SpeakerQueue and a plain list agree."""
+  rand = random.Random(seed)
+  q = speaker_queue.SpeakerQueue()
+  model = []
+  next_id = 0
+  for _ in range(2000):
+    op = rand.choice(['append', 'append', 'insert', 'remove', 'popleft', 'move'])
+    if op == 'append' or (op == 'insert' and rand.random() < 0.5):
+      pos = len(model) if op == 'append' else rand.randint(-2, len(model) + 2)
+      model.insert(pos, next_id)
+      q.insert(pos, next_id)
+      next_id += 1
+    elif op == 'insert':
+      model.insert(0, next_id)
+      q.appendleft(next_id)
+      next_id += 1
+    elif not model:
+      continue
+    elif op == 'remove':
+      m = rand.choice(model)
+      model.remove(m)
+      q.remove(m)
+    elif op == 'popleft':
+      assert q.popleft() == model.pop(0)
+    elif op == 'move':
+      m = rand.choice(model)
+      pos = rand.randint(0, len(model))
+      model.remove(m)
+      model.insert(pos, m)
+      q.move(m, pos)
+    assert list(q) == model, op
+    assert len(q) == len(model)
+    for i, m in enumerate(model):
+      assert q.index(m) == i and m in q
+    assert q.head(5) == model[:5]
+
+
+def test_speaker_queue_rejects_duplicates():
+  q = speaker_queue.SpeakerQueue([1, 2])
+  with pytest.raises(ValueError):
+    q.append(1)
+  with pytest.raises(ValueError):
+    q.appendleft(2)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_fair_share_matches_sorting(seed):
+  """FairShare pops by least time spoken, then by when members queued."""
+  rand = random.Random(seed)
+  fair = speaker_queue.FairShare()
+  # member => (spoken, when queued)
+  model = {}
+  queued = 0
+  for _ in range(2000):
+    op = rand.random()
+    if op < 0.5:
+      member = rand.randrange(50)
+      if member not in model:
+        spoken = rand.randrange(5)
+        model[member] = (spoken, queued)
+        queued += 1
+        fair.push(member, spoken)
+    elif op < 0.7 and model:
+      member = rand.choice(list(model))
+      del model[member]
+      fair.discard(member)
+    elif model:
+      want = min(model, key=model.get)
+      del model[want]
+      assert fair.pop() == want
+    order = sorted(model, key=model.get)
+    assert fair.ordered() == order
+    assert fair.head(3) == order[:3]
+    assert len(fair) == len(model)
+    for i, member in enumerate(order):
+      assert fair.index(member) == i
+
+
+# vim:ts=2:sw=2:expandtab